@@ -1,14 +1,75 @@
 # agents/caption_generator.py
-from openai import OpenAI
 from config import Config
 from exceptions import APIError
 from testing import mock_text_generation, should_mock
 from logger import logger
+from llm_client import get_openai_client
+from ledger import add_usage, metered
+from prompts import CAPTION, CAPTION_SHORTEN, message_tokens
+from metrics import record_api_error, timed
+from rate_limiter import get_limiter
 import random
+from typing import Dict, List, Optional
 
+def caption_problem(caption: str):
+    """Why a caption can't be used as-is, or None if it passes validation"""
+    if not caption:
+        return "empty"
+    if len(caption) > Config.CAPTION_MAX_LENGTH:
+        return f"{len(caption)} characters"
+    return None
+
+
+def _score(caption: str) -> float:
+    """Higher is better: close to the requested shape and well under the limit"""
+    hashtags = sum(1 for word in caption.split() if word.startswith("#"))
+    score = 0.0
+    if 3 <= hashtags <= 5:
+        score += 2
+    if "?" in caption:
+        score += 1
+    if len(caption) <= 250:
+        score += 1
+    # Prefer the shorter of otherwise equal captions
+    return score - len(caption) / 1000.0
+
+
+def pick_caption(candidates: List[str]) -> Optional[str]:
+    """Best candidate that passes validation, if any"""
+    valid = [c for c in candidates if caption_problem(c) is None]
+    return max(valid, key=_score) if valid else None
+
+
+def _create_completion(**kwargs):
+    # Each attempt is its own ledger entry, timed without the limiter wait
+    with metered("openai", kwargs["model"], "caption") as entry:
+        response = get_openai_client().chat.completions.create(**kwargs)
+        add_usage(entry, response.usage)
+        return response
+
+
+def _request_candidates(messages: List[Dict]) -> List[str]:
+    """One completion call returning ``CAPTION_CANDIDATES`` alternatives"""
+    n = max(1, Config.CAPTION_CANDIDATES)
+    response = get_limiter("openai").call(
+        _create_completion,
+        model=Config.MODEL,
+        messages=messages,
+        n=n,
+        tokens=message_tokens(messages, Config.MODEL) + 150 * n,
+        actual_tokens=lambda r: r.usage.total_tokens
+    )
+    return [(choice.message.content or "").strip() for choice in response.choices]
+
+
+@timed("caption")
 def generate_caption(post_idea: str) -> str:
     """
     Generate Instagram caption for a post idea with error handling and testing support
+
+    Several candidates come back from one call and the best valid one is
+    used. Only when none pass is a shortening request sent for the best
+    rejected candidate.
     """
     logger.info(f"Generating caption for: {post_idea[:50]}...")
     
@@ -17,37 +78,36 @@ def generate_caption(post_idea: str) -> str:
         return mock_text_generation(post_idea)
     
     try:
-        client = OpenAI(api_key=Config.OPENAI_API_KEY)
-        
-        response = client.chat.completions.create(
-            model=Config.MODEL,
-            messages=[{
-                "role": "user",
-                "content": f"""
-                Create an Instagram caption about: {post_idea}
-                
-                Requirements:
-                - First line: Attention-grabbing hook (include 1 relevant emoji)
-                - Second line: Value proposition or interesting fact
-                - Third line: Call-to-action or question
-                - Hashtags: 3-5 niche-specific hashtags at end
-                - Tone: {random.choice(["Funny", "Inspirational", "Curious"])}
-                - MAKE SURE THE CAPTION IS LESS THAN 250 CHARACTERS!!
-                - Avoid: Generic phrases like "check this out"
-                """
-            }]
-        )
-        
-        caption = response.choices[0].message.content.strip()
-        print(f"generated caption: {caption}")
-        
+        # Instructions go in the shared system message, the idea and tone last
+        messages = CAPTION.messages(Config.MODEL, post_idea=post_idea,
+                                    tone=random.choice(["Funny", "Inspirational", "Curious"]))
+
+        candidates = _request_candidates(messages)
+        caption = pick_caption(candidates)
+
+        for _ in range(Config.CAPTION_RETRIES):
+            if caption is not None:
+                break
+            rejected = max((c for c in candidates if c), key=_score, default="")
+            logger.warning(f"No valid caption among {len(candidates)} candidates "
+                           f"({caption_problem(rejected)}), asking for a shorter version")
+            if rejected:
+                retry_messages = CAPTION_SHORTEN.messages(Config.MODEL, caption=rejected)
+            else:
+                retry_messages = messages
+            candidates = _request_candidates(retry_messages)
+            caption = pick_caption(candidates)
+
         # Basic validation
-        if not caption or len(caption) > 350:
-            print(f"Caption is {len(caption)} characters")
+        if caption is None:
             raise APIError("Caption generation failed validation")
-            
+
+        logger.debug(f"Generated caption: {caption}")
         return caption
         
     except Exception as e:
         logger.error(f"Caption generation failed: {str(e)}")
-        raise APIError("Failed to generate caption") from e
\ No newline at end of file
+        # HTTP error responses are already counted by the shared client
+        if not isinstance(e, APIError) and getattr(e, "status_code", None) is None:
+            record_api_error("openai", e)
+        raise APIError("Failed to generate caption") from e
@@ -2,8 +2,15 @@ from typing import Dict
 from config import Config
 from exceptions import ValidationError
 from logger import logger
+from metrics import timed
 
-def content_planner(research_data: Dict) -> Dict:
+@timed("planning")
+def content_planner(research_data: Dict, num_posts: int = 2) -> Dict:
+    """
+    Plan posts alternating between niche trends and content trends.
+
+    The default two posts use the first trend of each category.
+    """
     logger.info("Starting content planning")
     
     try:
@@ -14,16 +21,18 @@ def content_planner(research_data: Dict) -> Dict:
         if not all(key in research_data for key in ["niche_trends", "content_trends"]):
             raise ValidationError("Invalid research data format")
             
-        # Extract first trend from each category
-        niche_trend = research_data["niche_trends"][0]  
-        content_trend = research_data["content_trends"][0]  
+        niche_trends = research_data["niche_trends"]
+        content_trends = research_data["content_trends"]
+        
+        plan = []
+        for i in range(num_posts):
+            # Even slots use niche trends, odd slots content trends, cycling through each list
+            if i % 2 == 0:
+                plan.append(f"Post about {niche_trends[(i // 2) % len(niche_trends)]}")
+            else:
+                plan.append(f"Post using {content_trends[(i // 2) % len(content_trends)]}")
         
-        return {
-            "content_plan": [
-                f"Post about {niche_trend}",
-                f"Post using {content_trend}"
-            ]
-        }
+        return {"content_plan": plan}
         
     except Exception as e:
         logger.error(f"Content planning failed: {str(e)}")
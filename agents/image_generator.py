@@ -1,34 +1,119 @@
-import replicate
+import threading
+from concurrent.futures import Future
 from config import Config
 from exceptions import APIError
 from testing import mock_image_generation, should_mock
+from ledger import metered
 from logger import logger
+from metrics import record_api_error, timed
+from prompts import IMAGE
+from predictions import track, webhooks_enabled
+from rate_limiter import get_limiter
 
+_client = None
+_client_lock = threading.Lock()
+
+def _replicate_client():
+    """Shared Replicate client, honouring REPLICATE_BASE_URL"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Imported on first use to keep startup cheap
+                import replicate
+                _client = replicate.Client(
+                    api_token=Config.REPLICATE_API_TOKEN,
+                    base_url=Config.REPLICATE_BASE_URL
+                )
+    return _client
+
+SDXL_MODEL = "stability-ai/sdxl"
+SDXL_VERSION = "39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b"
+
+
+def _image_input(post_idea: str, num_outputs: int = 1) -> dict:
+    prompt = IMAGE.render(post_idea=post_idea)
+    # Add negative prompts to avoid common issues
+    image_input = {
+        "prompt": prompt,
+        "negative_prompt": "blurry, text, watermark, low quality, cartoon, drawing",
+        "num_inference_steps": 40,
+        "guidance_scale": 9.5
+    }
+    if num_outputs > 1:
+        image_input["num_outputs"] = num_outputs
+    return image_input
+
+
+def _create_prediction(**kwargs):
+    # Submitting is free; the prediction itself is recorded when it completes
+    with metered("replicate", SDXL_MODEL, "image_submit") as entry:
+        entry["cost"] = 0.0
+        return _replicate_client().predictions.create(**kwargs)
+
+
+def _run_prediction(ref: str, **kwargs):
+    with metered("replicate", SDXL_MODEL, "image"):
+        return _replicate_client().run(ref, **kwargs)
+
+
+def submit_image(post_idea: str, num_outputs: int = 1) -> Future:
+    """
+    Start an SDXL prediction without waiting for it to finish; blocks only
+    while the Replicate concurrency limit's worth of predictions is in flight.
+
+    Returns a future of the output URLs (``num_outputs`` variants, SDXL
+    allows up to 4), completed by the webhook route or the poller.
+    """
+    if Config.TEST_MODE:
+        future = Future()
+        future.set_result(["https://placehold.co/600x400"] * num_outputs)
+        return future
+
+    # The concurrency slot is held until the prediction finishes, so
+    # REPLICATE_CONCURRENCY bounds predictions in flight, not just submissions
+    limiter = get_limiter("replicate")
+    release = limiter.hold()
+    try:
+        image_input = _image_input(post_idea, num_outputs)
+        params = {}
+        if webhooks_enabled():
+            params = {"webhook": Config.REPLICATE_WEBHOOK_URL, "webhook_events_filter": ["completed"]}
+        prediction = limiter.call(
+            _create_prediction,
+            version=SDXL_VERSION,
+            input=image_input,
+            held=True,
+            **params
+        )
+        future = track(prediction.id, image_input, num_outputs)
+
+    except Exception as e:
+        release(False)
+        logger.error(f"Image submission failed: {str(e)}")
+        record_api_error("replicate", e)
+        raise APIError("Failed to generate image") from e
+
+    future.add_done_callback(lambda done: release(done.exception() is None))
+    return future
+
+
+@timed("image")
 def generate_image(post_idea: str) -> str:
     try:
         if Config.TEST_MODE:
             return "https://placehold.co/600x400"
             
-        # Enhanced prompt template
-        prompt = f"""
-        Instagram-worthy photo for influencer post about: {post_idea}
-        Style: Professional photography, vibrant colors, trending Instagram aesthetic
-        Details: Include natural lighting, modern composition, aspirational mood
-        """
-        
-        # Add negative prompts to avoid common issues
-        output = replicate.run(
-            "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
-            input={
-                "prompt": prompt,
-                "negative_prompt": "blurry, text, watermark, low quality, cartoon, drawing",
-                "num_inference_steps": 40,
-                "guidance_scale": 9.5
-            }
+        # The concurrency slot is held for the whole prediction
+        output = get_limiter("replicate").call(
+            _run_prediction,
+            f"{SDXL_MODEL}:{SDXL_VERSION}",
+            input=_image_input(post_idea)
         )
         
         return str(output[0])
         
     except Exception as e:
         logger.error(f"Image generation failed: {str(e)}")
+        record_api_error("replicate", e)
         raise APIError("Failed to generate image") from e
\ No newline at end of file
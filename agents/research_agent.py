@@ -1,21 +1,198 @@
+import re
+from typing import Iterator, List, Optional, Tuple
 from config import Config
 from exceptions import APIError
 from testing import mock_text_generation, should_mock
 from logger import logger
-from openai import OpenAI
+from llm_client import get_openai_client
+from research_cache import get_cached_research, put_cached_research
+from ledger import add_usage, metered
+from prompts import RESEARCH, message_tokens
+from metrics import record_api_error, span
+from rate_limiter import get_limiter
+
+
+# "1." / "2)" / "-" / "*" list markers in front of a trend
+_MARKER = re.compile(r"^\s*(?:\d+[.)]\s*|[-*\u2022]\s+)")
+
+SECTIONS = ("niche_trends", "content_trends")
+
+
+_MARKUP = re.compile(r"^#+\s*|^\*\*|\*\*:?$")
+
+
+def _heading_section(line: str) -> Optional[str]:
+    """
+    Section a heading line opens: "niche_trends", "content_trends", "" for
+    an unrelated heading, or None when the line is not a heading at all.
+
+    Only short lines ending in ":" or wrapped in ``**``/``#`` markup count,
+    so trend text mentioning "content" or "niche" never switches sections.
+    """
+    if _MARKER.match(line) or len(line.split()) > 6:
+        return None
+    marked_up = line.startswith("#") or (line.startswith("**") and line.endswith(("**", "**:")))
+    if not (marked_up or line.endswith(":")):
+        return None
+    heading = _MARKUP.sub("", line).strip().rstrip(":").strip().lower()
+    if "content" in heading or "strateg" in heading:
+        return "content_trends"
+    if "niche" in heading or heading == "trends":
+        return "niche_trends"
+    return ""
+
+
+class ResearchParser:
+    """
+    Incremental parser for research text.
+
+    ``feed`` takes raw streamed text and returns ``(section, trend)`` for
+    every trend completed by it, so callers can act on trends before the
+    response is finished. Headings are matched loosely ("Niche Trends:",
+    "**Content Strategies**", "## Niche trends", ...) and list markers
+    stripped. In a numbered or bulleted list an unmarked line directly
+    under an item continues it (wrapped text), so an item is only emitted
+    once the next one starts; in an unmarked list every line is a trend.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._section = None
+        self._pending = None
+        self._listed = False
+        self.research = {section: [] for section in SECTIONS}
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        items = []
+        for line in lines:
+            items.extend(self._parse_line(line))
+        return items
+
+    def close(self) -> List[Tuple[str, str]]:
+        line, self._buffer = self._buffer, ""
+        return self._parse_line(line) + self._flush()
+
+    def _emit(self, trend: str) -> List[Tuple[str, str]]:
+        trend = trend.strip().strip("*_").strip()
+        if not trend:
+            return []
+        self.research[self._section].append(trend)
+        return [(self._section, trend)]
+
+    def _flush(self) -> List[Tuple[str, str]]:
+        pending, self._pending = self._pending, None
+        return self._emit(pending) if pending is not None else []
+
+    def _parse_line(self, line: str) -> List[Tuple[str, str]]:
+        text = line.strip()
+        if not text:
+            # A blank line ends a wrapped item; later unmarked text is not part of it
+            return self._flush()
+
+        section = _heading_section(text)
+        if section is not None:
+            items = self._flush()
+            self._section = section or None
+            self._listed = False
+            return items
+
+        if self._section is None:
+            # Preamble, or a section we don't collect
+            return []
+
+        if _MARKER.match(text):
+            items = self._flush()
+            self._listed = True
+            self._pending = _MARKER.sub("", text)
+            return items
+
+        if self._listed:
+            if self._pending is not None:
+                self._pending = f"{self._pending.rstrip()} {text}"
+            # Otherwise commentary after the list
+            return []
+        return self._emit(text)
 
 
 def parse_research(text: str) -> dict:
     """Convert raw text response to structured data"""
-    sections = text.split("\n\n")
-    return {
-        "niche_trends": sections[0].split("\n")[1:],
-        "content_trends": sections[1].split("\n")[1:]
-    }
+    parser = ResearchParser()
+    parser.feed(text)
+    parser.close()
+    return parser.research
+
+
+def _trend_lines(value) -> List[str]:
+    # Mock and TEST_MODE data hold newline-joined strings rather than lists
+    return value.split("\n") if isinstance(value, str) else list(value)
+
+
+def iter_research(niche: str, refresh: bool = False) -> Iterator[Tuple[str, str]]:
+    """
+    Yield ``(section, trend)`` pairs as the research completion streams in.
 
-def research_agent(niche: str) -> dict:
+    Cached, mock and TEST_MODE research is replayed through the same
+    interface. The full result is cached once the stream completes.
+    """
     logger.info(f"Starting research agent for: {niche}")
-    
+
+    with span("research"):
+        research = _canned_research(niche, refresh)
+        if research is not None:
+            for section in SECTIONS:
+                for trend in _trend_lines(research[section]):
+                    yield section, trend
+            return
+
+        try:
+            messages = RESEARCH.messages("gpt-3.5-turbo", niche=niche)
+
+            limiter = get_limiter("openai")
+            estimate = message_tokens(messages, "gpt-3.5-turbo") + 400
+            parser = ResearchParser()
+            usage = None
+            # Metered until the last chunk, so latency covers the whole response
+            with metered("openai", "gpt-3.5-turbo", "research") as entry:
+                # The limiter covers opening the stream; chunks are read after the slot is released
+                stream = limiter.call(
+                    get_openai_client().chat.completions.create,
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    temperature=0.7,  # More creative
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    tokens=estimate
+                )
+
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield from parser.feed(chunk.choices[0].delta.content)
+                yield from parser.close()
+                add_usage(entry, usage)
+
+            if usage is not None and limiter.tokens:
+                limiter.tokens.adjust(usage.total_tokens - estimate)
+
+            research = parser.research
+            if not all(research[section] for section in SECTIONS):
+                raise APIError("Research response had no trends")
+            if Config.RESEARCH_CACHE_TTL > 0:
+                put_cached_research(niche, research)
+
+        except Exception as e:
+            logger.error(f"Research failed: {str(e)}")
+            # HTTP error responses are already counted by the shared client
+            if not isinstance(e, APIError) and getattr(e, "status_code", None) is None:
+                record_api_error("openai", e)
+            raise APIError("Research agent failed") from e
+
+
+def _canned_research(niche: str, refresh: bool) -> Optional[dict]:
+    """Mock, cached or TEST_MODE research, or None when the API must be called"""
     if should_mock():
         logger.debug("Using mock research data")
         return {
@@ -29,37 +206,22 @@ def research_agent(niche: str) -> dict:
             ])
         }
     
-    try:
-        client = OpenAI(api_key=Config.OPENAI_API_KEY)
-        
-        if Config.TEST_MODE:
-            return {
-                "niche_trends": "1. Micro-workouts (5-min routines)\n2. Recovery tech (percussion massagers)",
-                "content_trends": "1. Progress comparison videos\n2. Myth-busting reels"
-            }
-            
-        # More focused research prompt    
-        research_prompt = f"""
-        Analyze {niche} industry trends for social media content creation.
-        Provide 5 specific, actionable trends in this format:
-        
-        Niche Trends:
-        1. [Specific trend 1]
-        2. [Specific trend 2]
-        
-        Content Strategies:
-        1. [Content type 1 with example]
-        2. [Content type 2 with example]
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": research_prompt}],
-            temperature=0.7  # More creative
-        )
-        
-        return parse_research(response.choices[0].message.content)
-        
-    except Exception as e:
-        logger.error(f"Research failed: {str(e)}")
-        raise APIError("Research agent failed") from e
\ No newline at end of file
+    if Config.RESEARCH_CACHE_TTL > 0 and not refresh:
+        cached = get_cached_research(niche)
+        if cached is not None:
+            return cached
+    
+    if Config.TEST_MODE:
+        return {
+            "niche_trends": "1. Micro-workouts (5-min routines)\n2. Recovery tech (percussion massagers)",
+            "content_trends": "1. Progress comparison videos\n2. Myth-busting reels"
+        }
+    return None
+
+
+def research_agent(niche: str, refresh: bool = False) -> dict:
+    """Research trends for a niche, served from the cache unless ``refresh`` is set"""
+    research = {section: [] for section in SECTIONS}
+    for section, trend in iter_research(niche, refresh=refresh):
+        research[section].append(trend)
+    return research
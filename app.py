@@ -1,24 +1,56 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from agents.research_agent import research_agent
-from agents.content_planner import content_planner
-from agents.image_generator import generate_image
-from agents.caption_generator import generate_caption
-from database import init_db, save_post
-from exceptions import AppError
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, abort, Response, stream_with_context
+from database import init_db, get_image_url, list_posts
+from image_store import image_path, is_valid_key
+from exceptions import AppError, RunInProgress, TwoFactorRequired, ValidationError
 from logger import logger
 from config import Config
-from instagram_poster import InstagramPoster, InstagrApiPoster
-from instagrapi.exceptions import ChallengeRequired
+from instagram_poster import create_poster
+from instagram_sessions import pop_2fa_code, store_2fa_code
+from jobs import enqueue_job, get_job, queue_stats, start_workers
+from pipeline import iter_pipeline
+from checkpoints import get_run, list_unfinished_runs, run_is_active
+from ledger import ledger_summary, run_cost
+from content_calendar import list_drafts, plan_calendar, start_scheduler
+from predictions import complete as complete_prediction, prediction_stats, verify_webhook
+from research_cache import cache_stats
+from metrics import render_prometheus
+import json
 import os
+import threading
 import time
-from datetime import datetime
 
 logger.info("Application started successfully")
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
-init_db()
+def _logged_in_poster():
+    """Poster for background jobs, sharing the in-memory session logged in by /create"""
+    poster = create_poster()
+    if not poster.login():
+        raise AppError("Instagram login failed")
+    return poster
+
+_started = False
+_startup_lock = threading.Lock()
+
+def startup():
+    """Create the schema and start job workers; runs once per process"""
+    global _started
+    with _startup_lock:
+        if _started:
+            return
+        init_db()
+        start_workers(poster_factory=_logged_in_poster)
+        if Config.CALENDAR_ENABLED:
+            start_scheduler(poster_factory=_logged_in_poster)
+        _started = True
+
+@app.before_request
+def _ensure_started():
+    # Fallback for servers that import ``app`` without calling startup()
+    if not _started:
+        startup()
 
 @app.route('/')
 def home():
@@ -31,72 +63,264 @@ def create_post():
         if not niche:
             return redirect(url_for('home'))
             
-        poster = InstagrApiPoster()
-        code = session.pop('2fa_code', None)
+        poster = create_poster()
+        code = pop_2fa_code()
         
         try:
             login_success = poster.login(code=code)
-        except ChallengeRequired:
+        except TwoFactorRequired:
             return redirect(url_for('show_2fa_form'))
             
         if not login_success:
             error_msg = "Invalid 2FA code. Please try again." if code else "Login failed"
             return render_template('2fa.html', error=error_msg)
             
-        # Start processing
-        start_time = datetime.now()
-        logger.info(f"Started processing niche: {niche}")
-        
-        research = research_agent(niche)
-        plan = content_planner(research)
-        
-        posts = []
-        failed_posts = []
-        
-        for idea in plan["content_plan"]:
-            try:
-                image_url = generate_image(idea)
-                caption = generate_caption(idea)
-                save_post(niche, idea, image_url, caption)
-                
-                # Add a small delay between posts
-                if poster.post_content(image_url, caption):
-                    posts.append({"image": image_url, "caption": caption})
-                else:
-                    failed_posts.append({"image": image_url, "caption": caption})
-                    logger.warning(f"Failed to post: {idea}")
-                
-            except Exception as e:
-                logger.error(f"Error processing idea: {str(e)}")
-                failed_posts.append({"error": str(e)})
+        refresh = request.form.get('refresh') == 'on'
+        carousel = request.form.get('carousel') == 'on'
+        job_id = enqueue_job(niche, refresh=refresh, carousel=carousel)
         
-        return render_template('results.html', 
-                            posts=posts, 
-                            failed_posts=failed_posts,
-                            time_taken=str(datetime.now() - start_time))
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({
+                "job_id": job_id,
+                "status_url": url_for('check_job_status', job_id=job_id)
+            }), 202
+        return redirect(url_for('show_job', job_id=job_id))
         
-    except ChallengeRequired:
+    except TwoFactorRequired:
         logger.info("2FA required - redirecting")
         return redirect(url_for('show_2fa_form'))
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         return render_template('error.html', message=str(e)), 500
 
+@app.route('/stream')
+def show_stream():
+    niche = request.args.get('niche', '').strip()
+    if not niche:
+        return redirect(url_for('home'))
+    return render_template('stream.html', niche=niche, refresh=request.args.get('refresh', ''))
+
+def _sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+@app.route('/create/stream')
+def create_post_stream():
+    """Server-Sent Events version of /create, pushing each post as it finishes"""
+    niche = request.args.get('niche', '').strip()
+    if not niche:
+        return jsonify({"error": "Missing niche"}), 400
+    refresh = request.args.get('refresh') == 'on'
+        
+    poster = create_poster()
+    code = pop_2fa_code()
+    try:
+        login_success = poster.login(code=code)
+    except TwoFactorRequired:
+        login_success = None
+        
+    def generate():
+        if login_success is None:
+            yield _sse({"event": "login_required", "url": url_for('show_2fa_form')})
+            return
+        if not login_success:
+            yield _sse({"event": "error", "message": "Login failed"})
+            return
+            
+        try:
+            for event in iter_pipeline(niche, poster=poster, refresh=refresh):
+                if event.get("image_key"):
+                    event["image"] = url_for('serve_image', key=event["image_key"])
+                yield _sse(event)
+        except Exception as e:
+            logger.error(f"Streaming error: {str(e)}")
+            yield _sse({"event": "error", "message": str(e)})
+            
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route('/2fa', methods=['GET', 'POST'])
 def show_2fa_form():
     if request.method == 'POST':
-        session['2fa_code'] = request.form.get('2fa_code', '')
+        store_2fa_code(request.form.get('2fa_code', ''))
         return redirect(url_for('create_post'))
     return render_template('2fa.html', error=request.args.get('error'))
 
 @app.route('/verify-2fa', methods=['POST'])
 def verify_2fa():
-    session['2fa_code'] = request.form.get('2fa_code', '')
+    store_2fa_code(request.form.get('2fa_code', ''))
     return redirect(url_for('create_post'))
 
+@app.route('/images/<key>')
+def serve_image(key):
+    if not is_valid_key(key):
+        abort(404)
+        
+    path = image_path(key)
+    if path is None:
+        # Evicted from the local store; fall back to the original URL
+        remote_url = get_image_url(key)
+        if remote_url:
+            return redirect(remote_url)
+        abort(404)
+        
+    # Keys are content hashes, so the file behind a key never changes
+    response = send_file(path, max_age=Config.IMAGE_CACHE_MAX_AGE, etag=key.split('.')[0])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/posts')
+def get_posts():
+    try:
+        page = list_posts(
+            niche=request.args.get('niche') or None,
+            since=request.args.get('since') or None,
+            until=request.args.get('until') or None,
+            cursor=request.args.get('cursor') or None,
+            limit=request.args.get('limit', 20, type=int)
+        )
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+        
+    for post in page["posts"]:
+        post["image"] = (url_for('serve_image', key=post["image_key"])
+                         if post["image_key"] else post["image_url"])
+    return jsonify(page)
+
+@app.route('/jobs/<job_id>')
+def show_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+        
+    if job["status"] == "completed":
+        return render_template('results.html', **job["result"])
+    if job["status"] == "failed":
+        return render_template('error.html', message=job["error"]), 500
+    return render_template('job.html', job=job)
+
+@app.route('/runs')
+def list_runs():
+    """Recent runs that did not complete, newest first"""
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    runs = list_unfinished_runs(limit)
+    for run in runs:
+        run["resumable"] = not run_is_active(run)
+    return jsonify({"runs": runs})
+
+@app.route('/runs/<run_id>')
+def show_run(run_id):
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Run not found"}), 404
+    run["cost"] = round(run_cost(run_id), 6)
+    run["ledger"] = ledger_summary(by="stage", run_id=run_id)
+    return jsonify(run)
+
+@app.route('/ledger')
+def show_ledger():
+    """Provider calls aggregated by niche, day, stage or model, e.g. /ledger?by=day&days=7"""
+    try:
+        days = request.args.get('days', type=float)
+        since = time.time() - days * 86400 if days else None
+        return jsonify({"by": request.args.get('by', 'niche'),
+                        "rows": ledger_summary(by=request.args.get('by', 'niche'), since=since)})
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/runs/<run_id>/resume', methods=['POST'])
+def resume_run(run_id):
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Run not found"}), 404
+    if run["status"] == "completed":
+        return jsonify({"error": "Run already completed"}), 409
+    if run_is_active(run):
+        return jsonify({"error": "Run is still in progress"}), 409
+
+    try:
+        job_id = enqueue_job(run["niche"], run_id=run_id)
+    except RunInProgress as e:
+        return jsonify({"error": str(e)}), 409
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            "job_id": job_id,
+            "status_url": url_for('check_job_status', job_id=job_id)
+        }), 202
+    return redirect(url_for('show_job', job_id=job_id))
+
+@app.route('/calendar', methods=['GET', 'POST'])
+def calendar():
+    if request.method == 'GET':
+        try:
+            limit = min(int(request.args.get('limit', 100)), 500)
+            drafts = list_drafts(status=request.args.get('status'),
+                                 niche=request.args.get('niche'), limit=limit)
+        except (ValueError, ValidationError) as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"drafts": drafts})
+        
+    payload = request.get_json(silent=True) or request.form
+    niche = (payload.get('niche') or '').strip()
+    if not niche:
+        return jsonify({"error": "niche is required"}), 400
+    try:
+        num_posts = int(payload.get('num_posts', 7))
+        slots = plan_calendar(niche, num_posts, refresh=payload.get('refresh') in (True, 'on', 'true'))
+    except (ValueError, ValidationError) as e:
+        return jsonify({"error": str(e)}), 400
+    except AppError as e:
+        logger.error(f"Calendar error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"niche": niche, "drafts": slots}), 201
+
+@app.route('/webhooks/replicate', methods=['POST'])
+def replicate_webhook():
+    body = request.get_data()
+    if not verify_webhook(request.headers, body):
+        logger.warning("Rejected Replicate webhook with bad signature")
+        abort(401)
+    try:
+        prediction = json.loads(body)
+    except ValueError:
+        abort(400)
+    complete_prediction(prediction)
+    return '', 204
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/status')
 def check_status():
-    return jsonify({"status": "processing"})
+    return jsonify({"jobs": queue_stats(), "predictions": prediction_stats(), "research_cache": cache_stats()})
+
+@app.route('/status/<job_id>')
+def check_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+        
+    now = time.time()
+    started_at = job["started_at"]
+    finished_at = job["finished_at"]
+    return jsonify({
+        "job_id": job["id"],
+        "niche": job["niche"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "stages": job["stages"],
+        "timings": {
+            "queued_for": round((started_at or now) - job["created_at"], 3),
+            "running_for": round((finished_at or now) - started_at, 3) if started_at else None
+        },
+        "result": job["result"],
+        "error": job["error"]
+    })
 
 if __name__ == '__main__':
+    startup()
     app.run(debug=Config.TEST_MODE)
\ No newline at end of file
@@ -0,0 +1,293 @@
+"""
+Local HTTP stand-ins for OpenAI, Replicate and Instagram.
+
+They speak just enough of each API for the pipeline to run end to end,
+with configurable latency and error injection per provider.
+"""
+import json
+import os
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+RESEARCH_TEXT = """Niche Trends:
+1. Micro-workouts that fit into a lunch break
+2. Wearable recovery tracking
+3. Community run clubs
+4. Plant-based performance nutrition
+5. Mobility over max lifts
+
+Content Strategies:
+1. 30-second form-check reels
+2. Before/after transformation carousels
+3. Myth-busting text overlays
+4. Day-in-the-life stories
+5. Weekly challenge series"""
+
+CAPTION_TEXT = (
+    "Five minutes is all it takes \U0001F525\n"
+    "Short daily sessions beat one long weekly grind.\n"
+    "What's your go-to quick workout?\n"
+    "#microworkout #fitnesstips #homeworkout"
+)
+
+
+def _png(size_kb: int, seed: str) -> bytes:
+    """Grayscale noise PNG of roughly ``size_kb`` kilobytes"""
+    side = max(1, int((size_kb * 1024) ** 0.5))
+    rng = random.Random(seed)
+    raw = b"".join(b"\x00" + bytes(rng.getrandbits(8) for _ in range(side)) for _ in range(side))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 0, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+
+class ProviderProfile:
+    """Latency (seconds, +/-25% jitter) and error rate for one provider"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self) -> float:
+        return self.latency * random.uniform(0.75, 1.25)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, profiles: Dict[str, ProviderProfile], image_kb: int = 64, port: int = 0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.profiles = profiles
+        self.image_kb = image_kb
+        self.predictions = {}
+        self.uploads = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def profile(self, provider: str) -> ProviderProfile:
+        return self.profiles.get(provider) or ProviderProfile()
+
+    def start(self) -> "FakeProviderServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-providers", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeProviderServer
+
+    def log_message(self, format, *args):
+        pass
+
+    # -- helpers -----------------------------------------------------------
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, payload, content_type: str = "application/json", headers: Optional[Dict] = None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_error(self, provider: str) -> bool:
+        profile = self.server.profile(provider)
+        if not profile.should_fail():
+            return False
+        headers = {"Retry-After": "1"} if profile.error_status == 429 else None
+        self._send(profile.error_status, {"error": {"message": f"injected {provider} error"}}, headers=headers)
+        return True
+
+    # -- routing -----------------------------------------------------------
+
+    def do_GET(self):
+        match = re.match(r"^/replicate/v1/predictions/([\w-]+)$", self.path)
+        if match:
+            return self._get_prediction(match.group(1))
+        match = re.match(r"^/replicate/v1/models/([\w.-]+)/([\w.-]+)/versions/(\w+)$", self.path)
+        if match:
+            return self._get_version(match.group(3))
+        match = re.match(r"^/files/([\w-]+)\.png$", self.path)
+        if match:
+            return self._send(200, _png(self.server.image_kb, match.group(1)), "image/png")
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self._body()
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            return self._chat_completion(json.loads(body or b"{}"))
+        if path == "/replicate/v1/predictions" or re.match(r"^/replicate/v1/models/.+/predictions$", path):
+            return self._create_prediction(json.loads(body or b"{}"))
+        if path == "/instagram/upload":
+            return self._upload(body)
+        self._send(404, {"error": "not found"})
+
+    # -- OpenAI ------------------------------------------------------------
+
+    def _chat_completion(self, request: Dict):
+        time.sleep(self.server.profile("openai").delay())
+        if self._inject_error("openai"):
+            return
+
+        prompt = " ".join(str(m.get("content", "")) for m in request.get("messages", []))
+        text = RESEARCH_TEXT if "Niche Trends" in prompt else CAPTION_TEXT
+        n = int(request.get("n") or 1)
+        usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": n * len(text) // 4,
+            "total_tokens": len(prompt) // 4 + n * len(text) // 4
+        }
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "created": int(time.time()),
+            "model": request.get("model") or "fake-model"
+        }
+
+        if request.get("stream"):
+            return self._stream_completion(base, text, usage, request)
+
+        self._send(200, dict(base, object="chat.completion", usage=usage, choices=[
+            {"index": i, "message": {"role": "assistant", "content": text},
+             "finish_reason": "stop", "logprobs": None}
+            for i in range(n)
+        ]))
+
+    def _stream_completion(self, base: Dict, text: str, usage: Dict, request: Dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def emit(chunk: Dict):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        for line in text.splitlines(keepends=True):
+            emit(dict(base, object="chat.completion.chunk", choices=[
+                {"index": 0, "delta": {"content": line}, "finish_reason": None}
+            ]))
+        emit(dict(base, object="chat.completion.chunk", choices=[
+            {"index": 0, "delta": {}, "finish_reason": "stop"}
+        ]))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            emit(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    # -- Replicate ---------------------------------------------------------
+
+    def _prediction_json(self, prediction: Dict) -> Dict:
+        done = time.time() >= prediction["ready_at"]
+        prediction_id = prediction["id"]
+        base = self.server.base_url
+        outputs = [f"{base}/files/{prediction_id}-{i}.png" for i in range(prediction["num_outputs"])]
+        return {
+            "id": prediction_id,
+            "model": "stability-ai/sdxl",
+            "version": prediction["version"],
+            "input": prediction["input"],
+            "status": "succeeded" if done else "processing",
+            "output": outputs if done else None,
+            "logs": "",
+            "error": None,
+            "metrics": {"predict_time": prediction["duration"]} if done else {},
+            "created_at": prediction["created_at"],
+            "started_at": prediction["created_at"],
+            "completed_at": prediction["ready_iso"] if done else None,
+            "urls": {
+                "get": f"{base}/replicate/v1/predictions/{prediction_id}",
+                "cancel": f"{base}/replicate/v1/predictions/{prediction_id}/cancel"
+            }
+        }
+
+    def _create_prediction(self, request: Dict):
+        if self._inject_error("replicate"):
+            return
+
+        duration = self.server.profile("replicate").delay()
+        now = time.time()
+        prediction = {
+            "id": uuid.uuid4().hex,
+            "version": request.get("version", ""),
+            "input": request.get("input", {}),
+            "num_outputs": int((request.get("input") or {}).get("num_outputs") or 1),
+            "duration": duration,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+            "ready_at": now + duration,
+            "ready_iso": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now + duration))
+        }
+        with self.server.lock:
+            self.server.predictions[prediction["id"]] = prediction
+
+        # Clients sending "Prefer: wait" expect the finished prediction
+        if self.headers.get("Prefer", "").startswith("wait"):
+            time.sleep(max(0.0, prediction["ready_at"] - time.time()))
+        self._send(201, self._prediction_json(prediction))
+
+    def _get_version(self, version_id: str):
+        # The Python client looks up the version schema to decide how to return output
+        self._send(200, {
+            "id": version_id,
+            "created_at": "2024-01-01T00:00:00Z",
+            "cog_version": "0.9.0",
+            "openapi_schema": {"components": {"schemas": {
+                "Output": {"type": "array", "items": {"type": "string", "format": "uri"}}
+            }}}
+        })
+
+    def _get_prediction(self, prediction_id: str):
+        with self.server.lock:
+            prediction = self.server.predictions.get(prediction_id)
+        if prediction is None:
+            return self._send(404, {"detail": "Not found"})
+        self._send(200, self._prediction_json(prediction))
+
+    # -- Instagram ---------------------------------------------------------
+
+    def _upload(self, body: bytes):
+        time.sleep(self.server.profile("instagram").delay())
+        if self._inject_error("instagram"):
+            return
+        with self.server.lock:
+            self.server.uploads += 1
+        self._send(200, {"status": "ok", "media_id": uuid.uuid4().hex, "bytes": len(body)})
+
+
+if __name__ == "__main__":
+    server = FakeProviderServer({
+        "openai": ProviderProfile(float(os.getenv("FAKE_OPENAI_LATENCY", "0.5"))),
+        "replicate": ProviderProfile(float(os.getenv("FAKE_REPLICATE_LATENCY", "2"))),
+        "instagram": ProviderProfile(float(os.getenv("FAKE_INSTAGRAM_LATENCY", "0.5")))
+    }, port=int(os.getenv("FAKE_PROVIDERS_PORT", "8765")))
+    print(f"Fake providers listening on {server.base_url}")
+    server.serve_forever()
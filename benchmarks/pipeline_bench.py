@@ -0,0 +1,248 @@
+"""
+End-to-end pipeline benchmark against local provider stand-ins.
+
+Runs research -> planning -> image/caption generation -> save -> post
+for every combination of plan size and concurrency, and reports
+per-stage p50/p95/p99 latency and posts/minute as JSON.
+
+    python -m benchmarks.pipeline_bench --plan-sizes 2,5 --concurrency 1,4 \
+        --runs 8 --latency openai=0.5,replicate=3,instagram=0.5 --output bench.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.fake_providers import FakeProviderServer, ProviderProfile
+from metrics import percentile
+
+PROVIDERS = ("openai", "replicate", "instagram")
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4) if values else 0.0,
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4) if values else 0.0
+    }
+
+
+def _parse_map(text: str, cast=float) -> Dict:
+    result = {}
+    for item in filter(None, (text or "").split(",")):
+        name, value = item.split("=")
+        result[name.strip()] = cast(value)
+    return result
+
+
+class Timings:
+    """Thread-safe collection of latency samples per stage"""
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def timed(self, stage: str, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return wrapper
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {stage: summarize(values) for stage, values in sorted(self._samples.items())}
+
+
+class FakeInstagramPoster:
+    """Poster stand-in that uploads the image bytes to the fake Instagram endpoint"""
+
+    def __init__(self, base_url: str, timings: Timings):
+        import requests
+        self.session = requests.Session()
+        self.upload_url = f"{base_url}/instagram/upload"
+        self.timings = timings
+
+    def post_content(self, image_url: str, caption: str, image_key: str = None) -> bool:
+        import image_store
+        start = time.perf_counter()
+        try:
+            path = image_store.image_path(image_key) if image_key else None
+            if path:
+                with open(path, "rb") as f:
+                    data = f.read()
+            else:
+                data = self.session.get(image_url, timeout=30).content
+            response = self.session.post(self.upload_url, data=data, timeout=30)
+            return response.ok
+        except Exception:
+            return False
+        finally:
+            self.timings.add("post_call", time.perf_counter() - start)
+
+
+def _configure_environment(server: FakeProviderServer, workdir: str):
+    """Point the app at the fake providers; must run before importing app modules"""
+    os.environ.update({
+        "TEST_MODE": "false",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        # Keep stdout for the JSON report
+        "LOG_STREAM": "stderr",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{server.base_url}/openai/v1",
+        "REPLICATE_API_TOKEN": "bench",
+        "REPLICATE_BASE_URL": f"{server.base_url}/replicate",
+        "REPLICATE_POLL_INTERVAL": "0.1",
+        "MODEL": "gpt-4o-mini",
+        "DATABASE_PATH": os.path.join(workdir, "bench.db"),
+        "IMAGE_STORE_DIR": os.path.join(workdir, "images"),
+        "RESEARCH_CACHE_TTL": "0"
+    })
+
+
+def run_benchmark(args) -> Dict:
+    latency = _parse_map(args.latency)
+    error_rate = _parse_map(args.error_rate)
+    profiles = {
+        name: ProviderProfile(latency.get(name, 0.0), error_rate.get(name, 0.0), args.error_status)
+        for name in PROVIDERS
+    }
+
+    server = FakeProviderServer(profiles, image_kb=args.image_kb).start()
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    _configure_environment(server, workdir)
+
+    import pipeline
+    from database import init_db
+    init_db()
+
+    results = []
+    try:
+        for plan_size in args.plan_sizes:
+            for concurrency in args.concurrency:
+                timings = Timings()
+                # Per-call timings for the provider-facing steps inside generation
+                originals = (pipeline.generate_image, pipeline.generate_caption, pipeline.store_image,
+                             pipeline.submit_image)
+                pipeline.generate_image = timings.timed("image_call", originals[0])
+                pipeline.generate_caption = timings.timed("caption_call", originals[1])
+                pipeline.store_image = timings.timed("image_store", originals[2])
+                # Async image backend: only the prediction submission blocks
+                pipeline.submit_image = timings.timed("image_submit", originals[3])
+
+                poster = FakeInstagramPoster(server.base_url, timings)
+                posted = failed = errors = 0
+                counts_lock = threading.Lock()
+
+                def one_run(i: int):
+                    nonlocal posted, failed, errors
+
+                    def on_stage(stage, status, elapsed):
+                        if status != "started":
+                            timings.add(stage, elapsed)
+
+                    start = time.perf_counter()
+                    try:
+                        result = pipeline.run_pipeline(
+                            f"bench niche {plan_size}-{concurrency}-{i}",
+                            poster=poster,
+                            on_stage=on_stage,
+                            num_posts=plan_size,
+                            max_workers=args.workers
+                        )
+                        with counts_lock:
+                            posted += len(result["posts"])
+                            failed += len(result["failed_posts"])
+                    except Exception:
+                        with counts_lock:
+                            errors += 1
+                    finally:
+                        timings.add("run_total", time.perf_counter() - start)
+
+                wall_start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    list(executor.map(one_run, range(args.runs)))
+                wall = time.perf_counter() - wall_start
+
+                (pipeline.generate_image, pipeline.generate_caption, pipeline.store_image,
+                 pipeline.submit_image) = originals
+
+                results.append({
+                    "plan_size": plan_size,
+                    "concurrency": concurrency,
+                    "runs": args.runs,
+                    "wall_time": round(wall, 3),
+                    "posts": posted,
+                    "failed_posts": failed,
+                    "failed_runs": errors,
+                    "posts_per_minute": round(posted / wall * 60, 2) if wall else 0.0,
+                    "stages": timings.summary()
+                })
+                print(f"plan_size={plan_size} concurrency={concurrency}: "
+                      f"{results[-1]['posts_per_minute']} posts/min, "
+                      f"run p95={results[-1]['stages'].get('run_total', {}).get('p95')}s",
+                      file=sys.stderr)
+    finally:
+        server.stop()
+
+    return {
+        "benchmark": "pipeline",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "plan_sizes": args.plan_sizes,
+            "concurrency": args.concurrency,
+            "runs": args.runs,
+            "workers": args.workers,
+            "latency": latency,
+            "error_rate": error_rate,
+            "error_status": args.error_status,
+            "image_kb": args.image_kb
+        },
+        "results": results
+    }
+
+
+def parse_args(argv=None):
+    ints = lambda text: [int(x) for x in text.split(",") if x]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plan-sizes", type=ints, default=[2, 5], help="comma-separated posts per plan")
+    parser.add_argument("--concurrency", type=ints, default=[1, 4], help="comma-separated parallel runs")
+    parser.add_argument("--runs", type=int, default=4, help="pipeline runs per combination")
+    parser.add_argument("--workers", type=int, default=None, help="asset workers per plan (default: config)")
+    parser.add_argument("--latency", default="openai=0.3,replicate=1.0,instagram=0.2",
+                        help="per-provider latency in seconds, e.g. openai=0.5,replicate=3")
+    parser.add_argument("--error-rate", default="", help="per-provider error rate, e.g. replicate=0.05")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected errors")
+    parser.add_argument("--image-kb", type=int, default=64, help="size of generated fake images")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Prompt size benchmark: today's templates against the previous inline f-strings.
+
+Renders every template for a set of sample niches and post ideas and
+reports, per template, the mean input tokens before and after, the
+reduction, and how many leading tokens are identical across calls (the
+part a provider-side prompt cache can reuse). Tokens are counted with
+tiktoken when it is installed, otherwise estimated.
+
+    python -m benchmarks.prompt_bench --output prompts.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+from prompts import CAPTION, IMAGE, RESEARCH, count_tokens, has_tokenizer, message_tokens
+
+MODEL = "gpt-4o-mini"
+
+NICHES = ["fitness", "vegan cooking", "personal finance", "travel photography", "indie game development"]
+IDEAS = [
+    "Post about Micro-workouts that fit into a lunch break",
+    "Post using 30-second form-check reels",
+    "Post about Plant-based performance nutrition",
+    "Post using Before/after transformation carousels",
+    "Post about Budget-friendly weekend getaways"
+]
+TONES = ["Funny", "Inspirational", "Curious"]
+
+
+# The templates as they were inlined in the agents, kept verbatim for comparison
+def _legacy_research(niche: str) -> List[Dict]:
+    return [{"role": "user", "content": f"""
+        Analyze {niche} industry trends for social media content creation.
+        Provide 5 specific, actionable trends in this format:
+
+        Niche Trends:
+        1. [Specific trend 1]
+        2. [Specific trend 2]
+
+        Content Strategies:
+        1. [Content type 1 with example]
+        2. [Content type 2 with example]
+        """}]
+
+
+def _legacy_caption(post_idea: str, tone: str) -> List[Dict]:
+    return [{"role": "user", "content": f"""
+                Create an Instagram caption about: {post_idea}
+
+                Requirements:
+                - First line: Attention-grabbing hook (include 1 relevant emoji)
+                - Second line: Value proposition or interesting fact
+                - Third line: Call-to-action or question
+                - Hashtags: 3-5 niche-specific hashtags at end
+                - Tone: {tone}
+                - MAKE SURE THE CAPTION IS LESS THAN 250 CHARACTERS!!
+                - Avoid: Generic phrases like "check this out"
+                """}]
+
+
+def _legacy_image(post_idea: str) -> str:
+    return f"""
+        Instagram-worthy photo for influencer post about: {post_idea}
+        Style: Professional photography, vibrant colors, trending Instagram aesthetic
+        Details: Include natural lighting, modern composition, aspirational mood
+        """
+
+
+def _flatten(prompt) -> str:
+    """Request text in the order the provider sees it"""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(f"{m['role']}: {m['content']}" for m in prompt)
+
+
+def _tokens(prompt) -> int:
+    return count_tokens(prompt, MODEL) if isinstance(prompt, str) else message_tokens(prompt, MODEL)
+
+
+def _shared_prefix_tokens(prompts: List) -> int:
+    texts = [_flatten(p) for p in prompts]
+    return count_tokens(os.path.commonprefix(texts), MODEL)
+
+
+def _measure(render: Callable, samples: List[tuple]) -> Dict:
+    prompts = [render(*sample) for sample in samples]
+    tokens = [_tokens(p) for p in prompts]
+    return {
+        "mean_tokens": round(sum(tokens) / len(tokens), 1),
+        "max_tokens": max(tokens),
+        "shared_prefix_tokens": _shared_prefix_tokens(prompts)
+    }
+
+
+def run_benchmark(seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    caption_samples = [(idea, rng.choice(TONES)) for idea in IDEAS]
+    cases = {
+        "research": (_legacy_research, lambda niche: RESEARCH.messages(MODEL, niche=niche),
+                     [(niche,) for niche in NICHES]),
+        "caption": (_legacy_caption, lambda idea, tone: CAPTION.messages(MODEL, post_idea=idea, tone=tone),
+                    caption_samples),
+        "image": (_legacy_image, lambda idea: IMAGE.render(post_idea=idea), [(idea,) for idea in IDEAS])
+    }
+
+    results = {}
+    for name, (legacy, current, samples) in cases.items():
+        before = _measure(legacy, samples)
+        after = _measure(current, samples)
+        results[name] = {
+            "legacy": before,
+            "current": after,
+            "token_reduction_pct": round(100.0 * (1 - after["mean_tokens"] / before["mean_tokens"]), 1)
+        }
+        print(f"{name}: {before['mean_tokens']} -> {after['mean_tokens']} tokens "
+              f"({results[name]['token_reduction_pct']}% fewer), shared prefix "
+              f"{before['shared_prefix_tokens']} -> {after['shared_prefix_tokens']}", file=sys.stderr)
+
+    return {
+        "benchmark": "prompts",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "model": MODEL,
+        "token_counter": "tiktoken" if has_tokenizer(MODEL) else "estimate",
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="seed for the sampled caption tones")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
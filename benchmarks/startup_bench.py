@@ -0,0 +1,112 @@
+"""
+Cold-start benchmark for the web app and the CLI.
+
+Each sample runs in a fresh interpreter and measures how long importing
+``app`` / ``main`` takes and how long until the first unit of work is
+done: the first HTTP request for the app (through Flask's test client,
+including the startup hook) and ``init_db`` plus a TEST_MODE pipeline
+run for the CLI. It also lists which provider SDKs ended up imported.
+
+    python -m benchmarks.startup_bench --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.pipeline_bench import summarize
+
+HEAVY_MODULES = ("openai", "httpx", "replicate", "instagrapi", "requests", "PIL", "flask")
+
+_PROBES = {
+    "app": """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get("/status")
+assert response.status_code == 200, response.status_code
+ready = time.perf_counter()
+""",
+    "main": """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.init_db()
+main.run_pipeline("startup bench")
+ready = time.perf_counter()
+"""
+}
+
+_REPORT = """
+import json, sys
+print("__STARTUP__" + json.dumps({
+    "import_seconds": imported - start,
+    "first_request_seconds": ready - imported,
+    "loaded": [name for name in %r if name in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _sample(target: str, workdir: str) -> Dict:
+    env = dict(os.environ,
+               TEST_MODE="true",
+               LOG_LEVEL="WARNING",
+               JOB_WORKERS="0",
+               DATABASE_PATH=os.path.join(workdir, f"{target}-{time.monotonic_ns()}.db"))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBES[target] + _REPORT],
+        cwd=root, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("__STARTUP__"))
+    return json.loads(line[len("__STARTUP__"):])
+
+
+def run_benchmark(targets: List[str], runs: int) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    results = {}
+    for target in targets:
+        samples = [_sample(target, workdir) for _ in range(runs)]
+        results[target] = {
+            "import": summarize([s["import_seconds"] for s in samples]),
+            "first_request": summarize([s["first_request_seconds"] for s in samples]),
+            "total": summarize([s["import_seconds"] + s["first_request_seconds"] for s in samples]),
+            "loaded_modules": samples[-1]["loaded"]
+        }
+        print(f"{target}: import p50={results[target]['import']['p50']}s, "
+              f"first request p50={results[target]['first_request']['p50']}s, "
+              f"loaded={results[target]['loaded_modules']}", file=sys.stderr)
+
+    return {
+        "benchmark": "startup",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default="app,main", help="comma-separated entry points to measure")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark([t for t in args.targets.split(",") if t], args.runs)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
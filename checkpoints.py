@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from config import Config
+from database import get_connection, transaction
+from exceptions import DatabaseError
+from logger import logger
+
+
+def create_run(niche: str) -> str:
+    """Register a new pipeline run and return its id"""
+    run_id = uuid.uuid4().hex
+    now = time.time()
+    try:
+        with transaction() as conn:
+            conn.execute(
+                '''INSERT INTO runs (id, niche, status, created_at, updated_at)
+                   VALUES (?,?,?,?,?)''',
+                (run_id, niche, "running", now, now)
+            )
+        return run_id
+
+    except sqlite3.Error as e:
+        logger.error(f"Run creation failed: {str(e)}")
+        raise DatabaseError("Failed to create run") from e
+
+
+def get_run(run_id: str) -> Optional[Dict]:
+    """Run row plus the (stage, index) pairs that already have checkpoints"""
+    try:
+        conn = get_connection()
+        row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = dict(row)
+        run["checkpoints"] = [
+            {"stage": stage, "index": idx}
+            for stage, idx in conn.execute(
+                "SELECT stage, idx FROM checkpoints WHERE run_id = ? ORDER BY created_at", (run_id,)
+            )
+        ]
+        return run
+
+    except sqlite3.Error as e:
+        logger.error(f"Run lookup failed: {str(e)}")
+        raise DatabaseError("Failed to load run") from e
+
+
+def finish_run(run_id: str, status: str, error: Optional[str] = None):
+    try:
+        with transaction() as conn:
+            conn.execute(
+                "UPDATE runs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), run_id)
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Run status update failed: {str(e)}")
+
+
+def mark_run_running(run_id: str):
+    """Flag a resumed run as executing again (clears the previous error)"""
+    finish_run(run_id, "running")
+
+
+def list_unfinished_runs(limit: int = 50) -> List[Dict]:
+    """Most recent runs that can still be resumed"""
+    try:
+        rows = get_connection().execute(
+            '''SELECT * FROM runs WHERE status != 'completed'
+               ORDER BY updated_at DESC LIMIT ?''',
+            (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    except sqlite3.Error as e:
+        logger.error(f"Run listing failed: {str(e)}")
+        raise DatabaseError("Failed to list runs") from e
+
+
+def run_is_active(run: Dict) -> bool:
+    """
+    Whether a run is presumably still executing somewhere: marked running
+    and checkpointed within RUN_STALE_AFTER. Runs left running by a crash
+    go stale and become resumable.
+    """
+    return run["status"] == "running" and time.time() - run["updated_at"] < Config.RUN_STALE_AFTER
+
+
+class RunCheckpoints:
+    """Reads and writes the stage outputs of one run"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        try:
+            rows = get_connection().execute(
+                "SELECT stage, idx, payload FROM checkpoints WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Checkpoint load failed: {str(e)}")
+            raise DatabaseError("Failed to load checkpoints") from e
+        self._done = {(stage, idx): json.loads(payload) for stage, idx, payload in rows}
+        if self._done:
+            logger.info(f"Resuming run {run_id} with {len(self._done)} checkpoints")
+
+    def get(self, stage: str, index: int = 0) -> Any:
+        return self._done.get((stage, index))
+
+    def save(self, stage: str, payload: Any, index: int = 0):
+        """Persist a stage output; a failed write only costs redoing the stage"""
+        try:
+            with transaction() as conn:
+                conn.execute(
+                    '''INSERT OR REPLACE INTO checkpoints (run_id, stage, idx, payload, created_at)
+                       VALUES (?,?,?,?,?)''',
+                    (self.run_id, stage, index, json.dumps(payload), time.time())
+                )
+                conn.execute("UPDATE runs SET updated_at = ? WHERE id = ?", (time.time(), self.run_id))
+            self._done[(stage, index)] = payload
+        except sqlite3.Error as e:
+            logger.warning(f"Checkpoint {stage}[{index}] not saved: {str(e)}")
@@ -6,13 +6,121 @@ load_dotenv()
 class Config:
     TEST_MODE = os.getenv("TEST_MODE", "False").lower() == "true"
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+    LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+    LOG_STREAM = os.getenv("LOG_STREAM", "stdout")  # "stdout" or "stderr"
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Fraction of DEBUG records kept per source module, e.g. "predictions=0.1,research_agent=0.5"
+    LOG_DEBUG_SAMPLING = os.getenv("LOG_DEBUG_SAMPLING", "")
+    DATABASE_PATH = os.getenv("DATABASE_PATH", "posts.db")
+    DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "10"))
+    DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", "8192"))
+    POSTS_PAGE_MAX = int(os.getenv("POSTS_PAGE_MAX", "100"))
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
+    # Override provider endpoints, e.g. to point at local stand-ins
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    REPLICATE_BASE_URL = os.getenv("REPLICATE_BASE_URL")
     MODEL=os.getenv("MODEL")
+
+    # "async" submits Replicate predictions and completes them by webhook/polling;
+    # "sync" blocks a worker thread in replicate.run
+    IMAGE_BACKEND = os.getenv("IMAGE_BACKEND", "async")
+    # Public URL of /webhooks/replicate and its signing secret; without both predictions are only polled
+    REPLICATE_WEBHOOK_URL = os.getenv("REPLICATE_WEBHOOK_URL")
+    REPLICATE_WEBHOOK_SECRET = os.getenv("REPLICATE_WEBHOOK_SECRET")
+    REPLICATE_POLL_INTERVAL = float(os.getenv("REPLICATE_POLL_INTERVAL", "1"))
+    # Polls back off with prediction age up to this, within their own request budget
+    REPLICATE_POLL_MAX_INTERVAL = float(os.getenv("REPLICATE_POLL_MAX_INTERVAL", "30"))
+    REPLICATE_POLL_RPM = int(os.getenv("REPLICATE_POLL_RPM", "300"))
+    # With a webhook configured, poll only predictions older than this
+    REPLICATE_WEBHOOK_GRACE = float(os.getenv("REPLICATE_WEBHOOK_GRACE", "30"))
+    REPLICATE_PREDICTION_TIMEOUT = float(os.getenv("REPLICATE_PREDICTION_TIMEOUT", "600"))
+
+    # Caption candidates requested per completion call
+    CAPTION_CANDIDATES = int(os.getenv("CAPTION_CANDIDATES", "3"))
+    CAPTION_MAX_LENGTH = int(os.getenv("CAPTION_MAX_LENGTH", "350"))
+    CAPTION_RETRIES = int(os.getenv("CAPTION_RETRIES", "1"))
+
+    # Shared OpenAI HTTP pool
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+    OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+    # Retries are handled by rate_limiter so throttling feeds back into the limits
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+
+    # Provider rate limits (0 disables a limit) and adaptive concurrency bounds
+    OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+    OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+    OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "4"))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+    REPLICATE_RPM = int(os.getenv("REPLICATE_RPM", "600"))
+    REPLICATE_CONCURRENCY = int(os.getenv("REPLICATE_CONCURRENCY", "2"))
+    REPLICATE_MAX_CONCURRENCY = int(os.getenv("REPLICATE_MAX_CONCURRENCY", "16"))
+    PROVIDER_MAX_ATTEMPTS = int(os.getenv("PROVIDER_MAX_ATTEMPTS", "4"))
+    PROVIDER_BACKOFF_BASE = float(os.getenv("PROVIDER_BACKOFF_BASE", "1"))
+    PROVIDER_BACKOFF_MAX = float(os.getenv("PROVIDER_BACKOFF_MAX", "60"))
     INSTAGRAM_ACCOUNT_ID = os.getenv("INSTAGRAM_ACCOUNT_ID")
     INSTAGRAM_ACCESS_TOKEN = os.getenv("INSTAGRAM_ACCESS_TOKEN")
 
     INSTAGRAM_USERNAME=os.getenv("INSTAGRAM_USERNAME")
     INSTAGRAM_PASSWORD=os.getenv("INSTAGRAM_USERNAME")
 
-    INSTAGRAM_SESSION_FILE = os.getenv("INSTAGRAM_SESSION_FILE", "instagram_session.json")
\ No newline at end of file
+    INSTAGRAM_SESSION_FILE = os.getenv("INSTAGRAM_SESSION_FILE", "instagram_session.json")
+    # Submitted 2FA codes older than this are discarded
+    TWO_FACTOR_CODE_TTL = float(os.getenv("TWO_FACTOR_CODE_TTL", "300"))
+    # "instagrapi" (username/password session) or "graph" (official Graph API, access token)
+    INSTAGRAM_BACKEND = os.getenv("INSTAGRAM_BACKEND", "instagrapi")
+    GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com/v19.0")
+    GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5"))
+    GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "30"))
+    GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "10"))
+    # Concurrent container creations/status checks for a batch or carousel
+    GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", "4"))
+    GRAPH_POLL_INITIAL = float(os.getenv("GRAPH_POLL_INITIAL", "1"))
+    GRAPH_POLL_MAX = float(os.getenv("GRAPH_POLL_MAX", "10"))
+    GRAPH_CONTAINER_TIMEOUT = float(os.getenv("GRAPH_CONTAINER_TIMEOUT", "300"))
+
+    # Research cache (TTL in seconds, 0 disables the cache)
+    RESEARCH_CACHE_TTL = int(os.getenv("RESEARCH_CACHE_TTL", "21600"))
+    RESEARCH_CACHE_MAX_ENTRIES = int(os.getenv("RESEARCH_CACHE_MAX_ENTRIES", "500"))
+
+    # Local content-addressed image store
+    IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "image_store")
+    IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(2 * 1024 ** 3)))
+    IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "31536000"))
+
+    # Pre-upload media preparation (Instagram feed limits)
+    MEDIA_MAX_WIDTH = int(os.getenv("MEDIA_MAX_WIDTH", "1080"))
+    MEDIA_JPEG_QUALITY = int(os.getenv("MEDIA_JPEG_QUALITY", "85"))
+    MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(8 * 1024 ** 2)))
+    MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+
+    # Max concurrent image/caption generation calls per plan
+    PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "10"))
+
+    # Provider call ledger: USD per 1K prompt/completion tokens as
+    # "model=prompt/completion,...", and per second of Replicate prediction time
+    LEDGER_ENABLED = os.getenv("LEDGER_ENABLED", "true").lower() == "true"
+    OPENAI_PRICES = os.getenv("OPENAI_PRICES", "gpt-3.5-turbo=0.0005/0.0015,gpt-4o-mini=0.00015/0.0006,gpt-4o=0.0025/0.01")
+    REPLICATE_COST_PER_SECOND = float(os.getenv("REPLICATE_COST_PER_SECOND", "0.000725"))
+    # Abort a run once its recorded cost passes this many USD (0 disables)
+    RUN_BUDGET = float(os.getenv("RUN_BUDGET", "0"))
+
+    # Content calendar: local publish hours, off-peak hours for prefetching
+    CALENDAR_SLOT_HOURS = [int(h) for h in os.getenv("CALENDAR_SLOT_HOURS", "9,13,19").split(",") if h.strip()]
+    CALENDAR_OFF_PEAK_HOURS = [int(h) for h in os.getenv("CALENDAR_OFF_PEAK_HOURS", "0,1,2,3,4,5").split(",") if h.strip()]
+    # Drafts due within this many hours are generated even during peak hours
+    CALENDAR_URGENT_HOURS = float(os.getenv("CALENDAR_URGENT_HOURS", "2"))
+    CALENDAR_PREFETCH_BATCH = int(os.getenv("CALENDAR_PREFETCH_BATCH", "10"))
+    CALENDAR_MAX_ATTEMPTS = int(os.getenv("CALENDAR_MAX_ATTEMPTS", "3"))
+    CALENDAR_POLL_INTERVAL = float(os.getenv("CALENDAR_POLL_INTERVAL", "60"))
+    CALENDAR_ENABLED = os.getenv("CALENDAR_ENABLED", "true").lower() == "true"
+
+    # Background job queue for /create
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+    # A "running" run with no checkpoint for this long is treated as crashed and resumable
+    RUN_STALE_AFTER = float(os.getenv("RUN_STALE_AFTER", "900"))
\ No newline at end of file
@@ -0,0 +1,265 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from agents.content_planner import content_planner
+from agents.research_agent import research_agent
+from config import Config
+from database import get_connection, save_post, transaction
+from exceptions import DatabaseError, ValidationError
+from locks import ProcessLock
+from logger import log_context, logger
+from pipeline import generate_assets
+
+# planned -> generating -> ready -> publishing -> published
+#                       \-> planned (retry) / failed
+DRAFT_STATUSES = ("planned", "generating", "ready", "publishing", "published", "failed")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def next_slots(count: int, after: Optional[datetime] = None) -> List[datetime]:
+    """The next ``count`` publish slots (CALENDAR_SLOT_HOURS, local time) after ``after``"""
+    after = after or datetime.now()
+    hours = sorted(set(Config.CALENDAR_SLOT_HOURS)) or [12]
+    slots = []
+    day = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    while len(slots) < count:
+        for hour in hours:
+            slot = day.replace(hour=hour)
+            if slot > after and len(slots) < count:
+                slots.append(slot)
+        day += timedelta(days=1)
+    return slots
+
+
+def is_off_peak(now: Optional[datetime] = None) -> bool:
+    return (now or datetime.now()).hour in Config.CALENDAR_OFF_PEAK_HOURS
+
+
+def plan_calendar(niche: str, num_posts: int, start: Optional[datetime] = None,
+                  refresh: bool = False) -> List[Dict]:
+    """
+    Research a niche, plan ``num_posts`` ideas across the full trend lists
+    and store them as drafts in the next free slots.
+    """
+    if num_posts < 1:
+        raise ValidationError("num_posts must be at least 1")
+
+    if start is None:
+        # Continue after the niche's last pending draft instead of double-booking slots
+        row = get_connection().execute(
+            "SELECT MAX(slot_at) FROM drafts WHERE niche = ? AND status NOT IN ('published', 'failed')",
+            (niche,)
+        ).fetchone()
+        start = max(datetime.now(), datetime.fromtimestamp(row[0])) if row[0] else None
+
+    with log_context(niche=niche):
+        research = research_agent(niche, refresh=refresh)
+        ideas = content_planner(research, num_posts=num_posts)["content_plan"]
+    slots = next_slots(len(ideas), start)
+
+    now = time.time()
+    try:
+        with transaction() as conn:
+            for idea, slot in zip(ideas, slots):
+                conn.execute(
+                    '''INSERT INTO drafts (niche, post_idea, slot_at, status, created_at, updated_at)
+                       VALUES (?,?,?,?,?,?)''',
+                    (niche, idea, slot.timestamp(), "planned", now, now)
+                )
+    except sqlite3.Error as e:
+        logger.error(f"Calendar planning failed: {str(e)}")
+        raise DatabaseError("Failed to save calendar") from e
+
+    logger.info(f"Planned {len(ideas)} drafts for {niche} from {slots[0]:%Y-%m-%d %H:%M}")
+    _wakeup.set()
+    return [{"post_idea": idea, "slot_at": slot.isoformat()} for idea, slot in zip(ideas, slots)]
+
+
+def list_drafts(status: Optional[str] = None, niche: Optional[str] = None, limit: int = 100) -> List[Dict]:
+    if status is not None and status not in DRAFT_STATUSES:
+        raise ValidationError(f"Unknown draft status: {status}")
+
+    query = "SELECT * FROM drafts WHERE 1 = 1"
+    params = []
+    if status:
+        query += " AND status = ?"
+        params.append(status)
+    if niche:
+        query += " AND niche = ?"
+        params.append(niche)
+    query += " ORDER BY slot_at LIMIT ?"
+    params.append(limit)
+
+    try:
+        rows = get_connection().execute(query, params).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Draft listing failed: {str(e)}")
+        raise DatabaseError("Failed to list drafts") from e
+
+    drafts = []
+    for row in rows:
+        draft = dict(row)
+        draft["slot_at"] = datetime.fromtimestamp(draft["slot_at"]).isoformat()
+        drafts.append(draft)
+    return drafts
+
+
+def _claim(from_status: str, to_status: str, due_before: float, limit: int) -> List[Dict]:
+    """Atomically move up to ``limit`` drafts due before ``due_before`` to ``to_status``"""
+    with transaction(immediate=True) as conn:
+        rows = conn.execute(
+            "SELECT * FROM drafts WHERE status = ? AND slot_at <= ? ORDER BY slot_at LIMIT ?",
+            (from_status, due_before, limit)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE drafts SET status = ?, updated_at = ? WHERE id = ?",
+            [(to_status, time.time(), row["id"]) for row in rows]
+        )
+        return [dict(row) for row in rows]
+
+
+def _update_draft(draft_id: int, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with transaction() as conn:
+        conn.execute(f"UPDATE drafts SET {columns} WHERE id = ?", (*fields.values(), draft_id))
+
+
+def prefetch_drafts(horizon_hours: Optional[float] = None, limit: Optional[int] = None) -> int:
+    """
+    Generate images and captions for planned drafts due within
+    ``horizon_hours`` (default: all of them off-peak, only urgent ones
+    otherwise) and mark them ready. Returns the number made ready.
+    """
+    if horizon_hours is None:
+        horizon_hours = float("inf") if is_off_peak() else Config.CALENDAR_URGENT_HOURS
+    due_before = time.time() + horizon_hours * 3600
+    drafts = _claim("planned", "generating", due_before, limit or Config.CALENDAR_PREFETCH_BATCH)
+    if not drafts:
+        return 0
+
+    logger.info(f"Prefetching assets for {len(drafts)} drafts")
+    # One batch per niche so every provider call is attributed to its niche
+    by_niche: Dict[str, List[Dict]] = {}
+    for draft in drafts:
+        by_niche.setdefault(draft["niche"], []).append(draft)
+    results = []
+    for niche, group in by_niche.items():
+        with log_context(niche=niche):
+            assets = generate_assets([draft["post_idea"] for draft in group])
+        results.extend(zip(group, assets))
+
+    ready = 0
+    for draft, asset in results:
+        if "error" in asset:
+            attempts = draft["attempts"] + 1
+            status = "failed" if attempts >= Config.CALENDAR_MAX_ATTEMPTS else "planned"
+            _update_draft(draft["id"], status=status, attempts=attempts, error=asset["error"])
+            continue
+        _update_draft(draft["id"], status="ready", image_url=asset["image"],
+                      image_key=asset["image_key"], caption=asset["caption"], error=None)
+        ready += 1
+    return ready
+
+
+def publish_due(poster=None, now: Optional[float] = None) -> Dict:
+    """
+    Publish every ready draft whose slot has arrived. Only the save and
+    upload happen here; generation was done ahead of time.
+    """
+    drafts = _claim("ready", "publishing", now or time.time(), Config.CALENDAR_PREFETCH_BATCH)
+    published = failed = 0
+    for draft in drafts:
+        with log_context(niche=draft["niche"]):
+            try:
+                save_post(draft["niche"], draft["post_idea"], draft["image_url"], draft["caption"],
+                          image_key=draft["image_key"])
+                ok = poster is None or poster.post_content(draft["image_url"], draft["caption"],
+                                                           image_key=draft["image_key"])
+                error = None if ok else "Posting failed"
+            except Exception as e:
+                logger.error(f"Draft {draft['id']} publish failed: {str(e)}")
+                ok, error = False, str(e)
+
+        if ok:
+            _update_draft(draft["id"], status="published", published_at=time.time())
+            published += 1
+        else:
+            _update_draft(draft["id"], status="failed", error=error)
+            failed += 1
+
+    if drafts:
+        logger.info(f"Published {published} drafts, {failed} failed")
+    return {"published": published, "failed": failed}
+
+
+def _has_due(now: float) -> bool:
+    row = get_connection().execute(
+        "SELECT 1 FROM drafts WHERE status IN ('planned', 'ready') AND slot_at <= ? LIMIT 1", (now,)
+    ).fetchone()
+    return row is not None
+
+
+def tick(poster_factory: Optional[Callable] = None):
+    """One scheduler pass: prefetch what is due for generation, then publish what is due"""
+    now = time.time()
+    # Anything already due but never generated is generated now, peak or not
+    if _has_due(now):
+        prefetch_drafts(horizon_hours=0)
+    while prefetch_drafts():
+        pass
+    if _has_due(now):
+        publish_due(poster_factory() if poster_factory else None, now)
+
+
+def _recover_drafts():
+    """
+    Drafts left generating by a previous scheduler are re-planned; drafts
+    left publishing are marked failed rather than risking a duplicate post.
+    """
+    with transaction() as conn:
+        conn.execute("UPDATE drafts SET status = 'planned' WHERE status = 'generating'")
+        conn.execute(
+            "UPDATE drafts SET status = 'failed', error = 'Interrupted while publishing' "
+            "WHERE status = 'publishing'"
+        )
+
+
+def _scheduler_loop(leader: ProcessLock, poster_factory: Optional[Callable]):
+    # Standby until the scheduling process exits and its lock is released
+    while not leader.acquire():
+        time.sleep(Config.CALENDAR_POLL_INTERVAL)
+    _recover_drafts()
+    logger.info("This process now runs the content calendar")
+
+    while True:
+        _wakeup.clear()
+        try:
+            tick(poster_factory)
+        except Exception as e:
+            logger.error(f"Calendar tick failed: {str(e)}")
+        _wakeup.wait(Config.CALENDAR_POLL_INTERVAL)
+
+
+def start_scheduler(poster_factory: Optional[Callable] = None):
+    """
+    Start the calendar thread. With several worker processes only the one
+    holding the scheduler lock runs it; the others stand by and take over
+    (recovering interrupted drafts) if that process exits.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return
+
+        leader = ProcessLock(f"{Config.DATABASE_PATH}.scheduler.lock")
+        _scheduler = threading.Thread(
+            target=_scheduler_loop, args=(leader, poster_factory), name="content-calendar", daemon=True
+        )
+        _scheduler.start()
+        logger.info("Started content calendar scheduler")
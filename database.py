@@ -1,62 +1,394 @@
+import atexit
+import base64
+import binascii
+import json
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, List, Optional
 from config import Config
-from exceptions import DatabaseError
+from exceptions import DatabaseError, ValidationError
 from logger import logger
+from metrics import timed
 
-def init_db():
+_local = threading.local()
+
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=Config.DB_BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers and a writer work at the same time across threads/processes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{Config.DB_CACHE_KB}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Long-lived connection for the current thread"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != Config.DATABASE_PATH:
+        if conn is not None:
+            conn.close()
+        conn = _open_connection(Config.DATABASE_PATH)
+        _local.conn = conn
+        _local.path = Config.DATABASE_PATH
+    return conn
+
+
+def close_connection():
+    """Close the current thread's connection, if any"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+# Closing the last connection checkpoints the WAL back into the database file
+atexit.register(close_connection)
+
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """
+    Run a block in one transaction on the thread's connection.
+
+    ``immediate`` takes the write lock up front, for read-then-write
+    blocks that must not race with other writers.
+    """
+    conn = get_connection()
+    if immediate:
+        conn.execute("BEGIN IMMEDIATE")
     try:
-        conn = sqlite3.connect('posts.db')
-        c = conn.cursor()
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS posts
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      niche TEXT NOT NULL,
-                      post_idea TEXT NOT NULL,
-                      image_url TEXT NOT NULL,
-                      caption TEXT NOT NULL,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
+        yield conn
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# Bump whenever init_db gains a table, column or index
+SCHEMA_VERSION = 5
+
+
+def init_db():
+    """
+    Create or migrate the schema once per database.
+
+    Safe to call from many processes at once: the first one migrates
+    under the write lock and records SCHEMA_VERSION, the others wait for
+    it and then find nothing to do.
+    """
+    try:
+        if get_connection().execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        with transaction(immediate=True) as conn:
+            c = conn.cursor()
+            if c.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return
+
+            c.execute('''CREATE TABLE IF NOT EXISTS posts
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          niche TEXT NOT NULL,
+                          post_idea TEXT NOT NULL,
+                          image_url TEXT NOT NULL,
+                          caption TEXT NOT NULL,
+                          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+            # Local image store key, added after the initial schema
+            columns = [row[1] for row in c.execute("PRAGMA table_info(posts)")]
+            if "image_key" not in columns:
+                c.execute("ALTER TABLE posts ADD COLUMN image_key TEXT")
+
+            # Keyset pagination walks these in (created_at, id) order;
+            # they supersede the single-column niche/created_at indexes
+            c.execute("DROP INDEX IF EXISTS idx_posts_niche")
+            c.execute("DROP INDEX IF EXISTS idx_posts_created_at")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_posts_niche_created ON posts (niche, created_at, id)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_id ON posts (created_at, id)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_posts_image_key ON posts (image_key)")
+
+            c.execute('''CREATE TABLE IF NOT EXISTS jobs
+                         (id TEXT PRIMARY KEY,
+                          niche TEXT NOT NULL,
+                          refresh INTEGER NOT NULL DEFAULT 0,
+                          status TEXT NOT NULL,
+                          stage TEXT,
+                          stages TEXT,
+                          result TEXT,
+                          error TEXT,
+                          created_at REAL NOT NULL,
+                          started_at REAL,
+                          finished_at REAL)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+            # Resumable job runs, added after the initial jobs schema
+            columns = [row[1] for row in c.execute("PRAGMA table_info(jobs)")]
+            if "run_id" not in columns:
+                c.execute("ALTER TABLE jobs ADD COLUMN run_id TEXT")
+            # host:pid of the process running the job, for crash recovery
+            if "worker" not in columns:
+                c.execute("ALTER TABLE jobs ADD COLUMN worker TEXT")
+            # Publish the run's images as one carousel post
+            if "carousel" not in columns:
+                c.execute("ALTER TABLE jobs ADD COLUMN carousel INTEGER NOT NULL DEFAULT 0")
+
+            c.execute('''CREATE TABLE IF NOT EXISTS runs
+                         (id TEXT PRIMARY KEY,
+                          niche TEXT NOT NULL,
+                          status TEXT NOT NULL,
+                          error TEXT,
+                          created_at REAL NOT NULL,
+                          updated_at REAL NOT NULL)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status, updated_at)")
+
+            c.execute('''CREATE TABLE IF NOT EXISTS drafts
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          niche TEXT NOT NULL,
+                          post_idea TEXT NOT NULL,
+                          slot_at REAL NOT NULL,
+                          status TEXT NOT NULL DEFAULT 'planned',
+                          image_url TEXT,
+                          image_key TEXT,
+                          caption TEXT,
+                          attempts INTEGER NOT NULL DEFAULT 0,
+                          error TEXT,
+                          created_at REAL NOT NULL,
+                          updated_at REAL NOT NULL,
+                          published_at REAL)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_drafts_status_slot ON drafts (status, slot_at)")
+
+            c.execute('''CREATE TABLE IF NOT EXISTS predictions
+                         (id TEXT PRIMARY KEY,
+                          status TEXT NOT NULL,
+                          input TEXT NOT NULL,
+                          num_outputs INTEGER NOT NULL DEFAULT 1,
+                          output TEXT,
+                          error TEXT,
+                          created_at REAL NOT NULL,
+                          updated_at REAL NOT NULL,
+                          completed_at REAL)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_predictions_status ON predictions (status, created_at)")
+
+            c.execute('''CREATE TABLE IF NOT EXISTS ledger
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          run_id TEXT,
+                          niche TEXT,
+                          provider TEXT NOT NULL,
+                          model TEXT,
+                          stage TEXT,
+                          prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                          completion_tokens INTEGER NOT NULL DEFAULT 0,
+                          latency REAL,
+                          cost REAL NOT NULL DEFAULT 0,
+                          outcome TEXT NOT NULL,
+                          created_at REAL NOT NULL)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_ledger_run ON ledger (run_id)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_ledger_created ON ledger (created_at)")
+
+            c.execute('''CREATE TABLE IF NOT EXISTS checkpoints
+                         (run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+                          stage TEXT NOT NULL,
+                          idx INTEGER NOT NULL DEFAULT 0,
+                          payload TEXT NOT NULL,
+                          created_at REAL NOT NULL,
+                          PRIMARY KEY (run_id, stage, idx))''')
+
+            c.execute('''CREATE TABLE IF NOT EXISTS research_cache
+                         (niche_key TEXT PRIMARY KEY,
+                          payload TEXT NOT NULL,
+                          created_at REAL NOT NULL,
+                          last_accessed REAL NOT NULL,
+                          hits INTEGER NOT NULL DEFAULT 0)''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_research_cache_last_accessed ON research_cache (last_accessed)")
+
+            # Instagram 2FA codes waiting for whichever worker handles the next login
+            c.execute('''CREATE TABLE IF NOT EXISTS two_factor_codes
+                         (username TEXT PRIMARY KEY,
+                          code TEXT NOT NULL,
+                          created_at REAL NOT NULL)''')
+            # The login challenge those codes answer, saved by the worker that hit it
+            c.execute('''CREATE TABLE IF NOT EXISTS two_factor_challenges
+                         (username TEXT PRIMARY KEY,
+                          params TEXT NOT NULL,
+                          created_at REAL NOT NULL)''')
+
+            c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
         logger.info("Database initialized successfully")
-        
+
     except sqlite3.Error as e:
         logger.error(f"Database initialization failed: {str(e)}")
         raise DatabaseError("Failed to initialize database") from e
-    finally:
-        if conn:
-            conn.close()
 
-def save_post(niche: str, post_idea: str, image_url, caption: str):
+
+def _post_row(post: Dict, created_at: str) -> tuple:
+    # Convert all inputs to strings explicitly
+    return (
+        str(post["niche"]),
+        str(post["post_idea"]),
+        str(post["image_url"]),  # Ensure this is a string
+        str(post["caption"]),
+        post.get("image_key"),
+        created_at
+    )
+
+
+@timed("db_save_posts")
+def save_posts(posts: List[Dict]):
+    """
+    Save a whole plan's posts in a single transaction.
+
+    Each post is a dict with ``niche``, ``post_idea``, ``image_url``,
+    ``caption`` and optionally ``image_key``.
+    """
     if Config.TEST_MODE:
         logger.debug("TEST_MODE: Skipping database save")
         return
-        
-    try:
-        # Convert all inputs to strings explicitly
-        conn = sqlite3.connect('posts.db')
-        c = conn.cursor()
-        
-        c.execute('''INSERT INTO posts 
-                     (niche, post_idea, image_url, caption, created_at)
-                     VALUES (?,?,?,?,?)''',
-                  (
-                      str(niche), 
-                      str(post_idea), 
-                      str(image_url),  # Ensure this is a string
-                      str(caption), 
-                      datetime.now().isoformat()
-                  ))
-        
-        conn.commit()
+    if not posts:
+        return
+
+    try:
+        created_at = datetime.now().isoformat()
+        with transaction() as conn:
+            conn.executemany('''INSERT INTO posts
+                                (niche, post_idea, image_url, caption, image_key, created_at)
+                                VALUES (?,?,?,?,?,?)''',
+                             [_post_row(post, created_at) for post in posts])
+
+        logger.info(f"Saved {len(posts)} posts")
+
+    except sqlite3.Error as e:
+        logger.error(f"Database save failed: {str(e)}")
+        raise DatabaseError("Failed to save posts") from e
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise DatabaseError("Unexpected database error") from e
+
+
+@timed("db_save_post")
+def save_post(niche: str, post_idea: str, image_url, caption: str, image_key: str = None):
+    if Config.TEST_MODE:
+        logger.debug("TEST_MODE: Skipping database save")
+        return
+
+    try:
+        post = {
+            "niche": niche,
+            "post_idea": post_idea,
+            "image_url": image_url,
+            "caption": caption,
+            "image_key": image_key
+        }
+        with transaction() as conn:
+            conn.execute('''INSERT INTO posts
+                            (niche, post_idea, image_url, caption, image_key, created_at)
+                            VALUES (?,?,?,?,?,?)''',
+                         _post_row(post, datetime.now().isoformat()))
+
         logger.info(f"Saved post: {post_idea[:50]}...")
-        
+
     except sqlite3.Error as e:
         logger.error(f"Database save failed: {str(e)}")
         raise DatabaseError("Failed to save post") from e
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise DatabaseError("Unexpected database error") from e
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+
+
+def get_image_url(image_key: str):
+    """Original remote URL for a stored image key"""
+    try:
+        row = get_connection().execute(
+            "SELECT image_url FROM posts WHERE image_key = ? ORDER BY id DESC LIMIT 1",
+            (image_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    except sqlite3.Error as e:
+        logger.error(f"Image lookup failed: {str(e)}")
+        raise DatabaseError("Failed to look up image") from e
+
+
+def _encode_cursor(created_at: str, post_id: int) -> str:
+    raw = json.dumps([created_at, post_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), int(post_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValidationError("Invalid cursor") from e
+
+
+def _parse_timestamp(value: str, name: str) -> str:
+    """ISO timestamp in the naive local form posts are stored with"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ValidationError(f"Invalid {name} timestamp: {value}") from e
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def list_posts(niche: Optional[str] = None, since: Optional[str] = None,
+               until: Optional[str] = None, cursor: Optional[str] = None,
+               limit: int = 20) -> Dict:
+    """
+    List posts newest first using keyset pagination on (created_at, id).
+
+    ``since``/``until`` are ISO timestamps (inclusive/exclusive); anything
+    else raises ValidationError.
+    Returns ``posts``, ``has_more`` and ``next_cursor``; pass the cursor
+    back to get the next page. No COUNT(*) is ever run.
+    """
+    limit = max(1, min(int(limit), Config.POSTS_PAGE_MAX))
+
+    clauses = []
+    params = []
+    if niche:
+        clauses.append("niche = ?")
+        params.append(niche)
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(_parse_timestamp(since, "since"))
+    if until:
+        clauses.append("created_at < ?")
+        params.append(_parse_timestamp(until, "until"))
+    if cursor:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(_decode_cursor(cursor))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    try:
+        # Fetch one extra row to know whether another page exists
+        rows = get_connection().execute(
+            f'''SELECT id, niche, post_idea, image_url, image_key, caption, created_at
+                FROM posts {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?''',
+            (*params, limit + 1)
+        ).fetchall()
+
+    except sqlite3.Error as e:
+        logger.error(f"Post listing failed: {str(e)}")
+        raise DatabaseError("Failed to list posts") from e
+
+    has_more = len(rows) > limit
+    posts = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if has_more:
+        last = posts[-1]
+        next_cursor = _encode_cursor(last["created_at"], last["id"])
+
+    return {"posts": posts, "has_more": has_more, "next_cursor": next_cursor}
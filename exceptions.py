@@ -11,4 +11,13 @@ class DatabaseError(AppError):
     """Exception for database-related errors"""
 
 class ValidationError(AppError):
-    """Exception for input validation errors"""
\ No newline at end of file
+    """Exception for input validation errors"""
+
+class RunInProgress(AppError):
+    """A run is already being executed or queued"""
+
+class TwoFactorRequired(AppError):
+    """Instagram asked for a 2FA / challenge code"""
+
+class BudgetExceeded(AppError):
+    """A run spent more than its provider budget"""
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import Optional
+from config import Config
+from exceptions import APIError
+from logger import logger
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}\.(jpg|png|webp)$")
+
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp"
+}
+
+_evict_lock = threading.Lock()
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(KEY_PATTERN.match(key or ""))
+
+
+def _key_path(key: str) -> str:
+    # Shard by hash prefix to keep directories small
+    return os.path.join(Config.IMAGE_STORE_DIR, key[:2], key)
+
+
+def image_path(key: str) -> Optional[str]:
+    """Local path for a stored image, or None if it is not (or no longer) on disk"""
+    if not is_valid_key(key):
+        return None
+    path = _key_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        # Bump mtime so eviction treats this image as recently used
+        os.utime(path)
+    except OSError:
+        pass
+    return path
+
+
+def store_image(url: str) -> str:
+    """
+    Download an image once and store it under its content hash.
+
+    Returns the image key (``<sha256>.<ext>``). Identical content is
+    stored only once.
+    """
+    import requests
+    os.makedirs(Config.IMAGE_STORE_DIR, exist_ok=True)
+    temp_path = None
+    try:
+        response = requests.get(url, stream=True, timeout=(5, 60))
+        response.raise_for_status()
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        extension = _EXTENSIONS.get(content_type, ".jpg")
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=Config.IMAGE_STORE_DIR, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                digest.update(chunk)
+                f.write(chunk)
+
+        key = digest.hexdigest() + extension
+        path = _key_path(key)
+
+        if os.path.exists(path):
+            logger.debug(f"Image already stored: {key}")
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            temp_path = None
+            logger.info(f"Stored image: {key}")
+
+        evict()
+        return key
+
+    except Exception as e:
+        logger.error(f"Image store failed: {str(e)}")
+        raise APIError("Failed to store image") from e
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def evict(max_bytes: Optional[int] = None):
+    """Remove least recently used images until the store fits its size cap"""
+    limit = max_bytes if max_bytes is not None else Config.IMAGE_STORE_MAX_BYTES
+    if limit <= 0 or not os.path.isdir(Config.IMAGE_STORE_DIR):
+        return
+
+    with _evict_lock:
+        files = []
+        for shard in os.scandir(Config.IMAGE_STORE_DIR):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if is_valid_key(entry.name):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        if total <= limit:
+            return
+
+        # Evict down to 90% of the cap so we don't evict on every store
+        target = int(limit * 0.9)
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.info(f"Evicted image: {os.path.basename(path)}")
+            except OSError as e:
+                logger.warning(f"Image eviction failed: {str(e)}")
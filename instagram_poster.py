@@ -1,147 +1,212 @@
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Dict, List
 from config import Config
+from exceptions import APIError, ValidationError
 from logger import logger
-from instagrapi import Client  # Import instagrapi
-from getpass import getpass # To get the code without showing it in the console
-
-import os
-from instagrapi.exceptions import  ChallengeRequired, LoginRequired
-import tempfile
-from getpass import getpass # To get the code without showing it in the console
-from flask import session
+import image_store
+from metrics import call_failures, record_api_error, span, timed
+from instagram_sessions import get_session
+from media import prepared_image
 import time
 import random
 from dotenv import load_dotenv
 
-import os
-import time
-import random
-from instagrapi import Client
+load_dotenv()
 
-import logging
 
-load_dotenv()
+_graph_session = None
+_graph_session_lock = threading.Lock()
+
+
+def _get_graph_session():
+    """Process-wide requests.Session with a connection pool sized for batch publishing"""
+    global _graph_session
+    if _graph_session is None:
+        with _graph_session_lock:
+            if _graph_session is None:
+                import requests
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=Config.GRAPH_POOL_SIZE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _graph_session = session
+    return _graph_session
+
+
+class ContainerError(APIError):
+    """A media container ended in ERROR/EXPIRED or never finished"""
 
 
-class InstagramPoster:  #not used atm
-    def __init__(self):
-        self.base_url = "https://graph.facebook.com/v19.0"
-        self.access_token = Config.INSTAGRAM_ACCESS_TOKEN
-        self.ig_user_id = Config.INSTAGRAM_ACCOUNT_ID
+class InstagramPoster:
+    """
+    Publishing through the official Graph API.
 
-    def post_to_instagram(self, image_url: str, caption: str) -> bool:
-        """Publish post to Instagram using Facebook Graph API"""
+    Each post is a media container that Instagram fetches and processes
+    asynchronously; it is polled with backoff until FINISHED and then
+    published. Containers for a batch or carousel are created concurrently.
+    """
+
+    def __init__(self, access_token: str = None, ig_user_id: str = None):
+        self.base_url = Config.GRAPH_API_URL
+        self.access_token = access_token or Config.INSTAGRAM_ACCESS_TOKEN
+        self.ig_user_id = ig_user_id or Config.INSTAGRAM_ACCOUNT_ID
+        self.session = _get_graph_session()
+
+    def login(self, code=None) -> bool:
+        """Token based; nothing to log in to"""
+        return bool(self.access_token and self.ig_user_id)
+
+    def _request(self, method: str, path: str, **params) -> dict:
+        # In a header rather than the query string, so it never shows up in
+        # exception messages or logs that include the request URL
+        headers = {"Authorization": f"Bearer {self.access_token}"}
         try:
-            # Step 1: Upload image
-            image_id = self._upload_image(image_url)
-            
-            # Step 2: Create container
-            container_id = self._create_container(image_id, caption)
-            
-            # Step 3: Publish
-            return self._publish_post(container_id)
-            
+            response = self.session.request(
+                method, f"{self.base_url}/{path}", params=params, headers=headers,
+                timeout=(Config.GRAPH_CONNECT_TIMEOUT, Config.GRAPH_READ_TIMEOUT)
+            )
+        except Exception as e:
+            record_api_error("instagram", e)
+            raise APIError(f"Graph API {method} {path} failed: {type(e).__name__}") from e
+
+        if not response.ok:
+            record_api_error("instagram", response.status_code)
+            try:
+                detail = response.json()["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                detail = response.reason
+            raise APIError(f"Graph API {method} {path} failed: {response.status_code} {detail}")
+        return response.json()
+
+    def create_container(self, image_url: str, caption: str = None, carousel_item: bool = False) -> str:
+        """Create an image container; carousel children carry no caption"""
+        params = {"image_url": image_url}
+        if carousel_item:
+            params["is_carousel_item"] = "true"
+        elif caption is not None:
+            params["caption"] = caption
+        return self._request("POST", f"{self.ig_user_id}/media", **params)["id"]
+
+    def create_carousel_container(self, children: List[str], caption: str) -> str:
+        return self._request(
+            "POST", f"{self.ig_user_id}/media",
+            media_type="CAROUSEL", children=",".join(children), caption=caption
+        )["id"]
+
+    def wait_for_container(self, container_id: str) -> str:
+        """Poll the container status with exponential backoff until it can be published"""
+        delay = Config.GRAPH_POLL_INITIAL
+        deadline = time.monotonic() + Config.GRAPH_CONTAINER_TIMEOUT
+        while True:
+            status = self._request("GET", container_id, fields="status_code").get("status_code")
+            if status in ("FINISHED", "PUBLISHED"):
+                return container_id
+            if status in ("ERROR", "EXPIRED"):
+                raise ContainerError(f"Container {container_id} status {status}")
+            if time.monotonic() + delay > deadline:
+                raise ContainerError(f"Container {container_id} not ready after "
+                                     f"{Config.GRAPH_CONTAINER_TIMEOUT:.0f}s (status {status})")
+            time.sleep(delay)
+            delay = min(delay * 2, Config.GRAPH_POLL_MAX)
+
+    def publish(self, container_id: str) -> str:
+        return self._request("POST", f"{self.ig_user_id}/media_publish", creation_id=container_id)["id"]
+
+    def _ready_container(self, image_url: str, caption: str = None, carousel_item: bool = False) -> str:
+        return self.wait_for_container(self.create_container(image_url, caption, carousel_item))
+
+    @timed("instagram_post")
+    def post_content(self, image_url: str, caption: str, image_key: str = None) -> bool:
+        """
+        Publish one image post. ``image_key`` is ignored: Instagram fetches
+        the image itself, so it needs the public URL.
+        """
+        try:
+            if Config.TEST_MODE:
+                logger.info("TEST_MODE: Skipping Instagram post")
+                return True
+            self.publish(self._ready_container(image_url, caption))
+            return True
         except Exception as e:
             logger.error(f"Instagram posting failed: {str(e)}")
+            call_failures.inc(call="instagram_post")
             return False
 
-    def _upload_image(self, image_url: str) -> str:
-        """Upload image to Instagram's server"""
-        url = f"{self.base_url}/{self.ig_user_id}/media"
-        params = {
-            "image_url": image_url,
-            "access_token": self.access_token
-        }
-        
-        response = requests.post(url, params=params)
-        response.raise_for_status()
-        return response.json()['id']
-
-    def _create_container(self, image_id: str, caption: str) -> str:
-        """Create post container"""
-        url = f"{self.base_url}/{self.ig_user_id}/media_publish"
-        params = {
-            "creation_id": image_id,
-            "caption": caption,
-            "access_token": self.access_token
-        }
-        
-        response = requests.post(url, params=params)
-        response.raise_for_status()
-        return response.json()['id']
-
-    def _publish_post(self, container_id: str) -> bool:
-        """Confirm publication"""
-        url = f"{self.base_url}/{container_id}"
-        params = {"fields": "status_code", "access_token": self.access_token}
-        
-        response = requests.get(url, params=params)
-        return response.json()['status_code'] == "FINISHED"
-    
-        
+    # Kept for callers of the original Graph API helper
+    post_to_instagram = post_content
+
+    @timed("instagram_carousel")
+    def post_carousel(self, image_urls: List[str], caption: str) -> bool:
+        """Publish up to 10 images as one carousel post"""
+        if not 2 <= len(image_urls) <= 10:
+            raise ValidationError("A carousel needs 2 to 10 images")
+        try:
+            if Config.TEST_MODE:
+                logger.info("TEST_MODE: Skipping Instagram carousel")
+                return True
+            with ThreadPoolExecutor(max_workers=Config.GRAPH_MAX_CONCURRENCY,
+                                    thread_name_prefix="graph") as executor:
+                children = list(executor.map(
+                    lambda url: self._ready_container(url, carousel_item=True), image_urls
+                ))
+            parent = self.wait_for_container(self.create_carousel_container(children, caption))
+            self.publish(parent)
+            return True
+        except Exception as e:
+            logger.error(f"Instagram carousel failed: {str(e)}")
+            call_failures.inc(call="instagram_carousel")
+            return False
+
+    def post_batch(self, posts: List[Dict]) -> List[bool]:
+        """
+        Publish ``[{"image_url", "caption"}, ...]``: containers are created and
+        awaited concurrently, then published in order. Returns one flag per post.
+        """
+        if Config.TEST_MODE:
+            logger.info(f"TEST_MODE: Skipping {len(posts)} Instagram posts")
+            return [True] * len(posts)
+
+        with ThreadPoolExecutor(max_workers=Config.GRAPH_MAX_CONCURRENCY,
+                                thread_name_prefix="graph") as executor:
+            futures = [
+                executor.submit(copy_context().run, self._ready_container, post["image_url"], post["caption"])
+                for post in posts
+            ]
+
+        results = []
+        for post, future in zip(posts, futures):
+            try:
+                with span("instagram_post"):
+                    self.publish(future.result())
+                results.append(True)
+            except Exception as e:
+                logger.error(f"Instagram posting failed: {str(e)}")
+                results.append(False)
+        return results
+
+
 class InstagrApiPoster:
-    def __init__(self):
-        self.client = Client()
-        self._setup_device()
-        self.session_file = "instagram_session.json"
-        
-    def _setup_device(self):
-        self.client.set_user_agent("Instagram 289.0.0.30.120 Android (25/7.1.2; 380dpi; 1080x1920; unknown/Android; realme RMX1993; RMX1993; qcom; en_US; 367216753)")
-        self.client.set_device({
-            "manufacturer": "realme",
-            "model": "RMX1993",
-            "android_version": 25,
-            "android_release": "7.1.2"
-        })
+    def __init__(self, username: str = None):
+        # Clients are pooled per account; constructing a poster is cheap
+        self.session = get_session(username)
+
+    @property
+    def client(self):
+        return self.session.client
         
     def _human_delay(self, min_delay=1, max_delay=3):  # Updated to accept parameters
         """Human-like delay with configurable range"""
         time.sleep(random.uniform(min_delay, max_delay))
         
     def login(self, code=None):
-        try:
-            if os.path.exists(self.session_file):
-                try:
-                    self.client.load_settings(self.session_file)
-                    # Changed from get_user_id() to check authentication properly
-                    if self.client.user_id:
-                        logger.info("Reused existing session")
-                        return True
-                except Exception as e:
-                    logger.warning(f"Session load failed: {str(e)}")
-
-            self._human_delay()
-            
-            if code:
-                # Handle 2FA code submission
-                challenge = self.client.challenge_resolve(self.client.last_login_params)
-                self.client.challenge_code(code.strip(), challenge)
-                if self.client.user_id:
-                    self.client.dump_settings(self.session_file)
-                    return True
-                return False
-            
-            # Normal login
-            login_result = self.client.login(
-                Config.INSTAGRAM_USERNAME,
-                Config.INSTAGRAM_PASSWORD
-            )
-            
-            if login_result:
-                self.client.dump_settings(self.session_file)
-                logger.info("New login successful")
-                return True
-            return False
-            
-        except ChallengeRequired as e:
-            logger.warning("2FA challenge required")
-            self.client.dump_settings(self.session_file)
-            raise
-        except Exception as e:
-            logger.error(f"Login error: {str(e)}")
-            return False
+        return self.session.login(code=code)
 
-    def post_content(self, image_url: str, caption: str) -> bool:
+    @timed("instagram_post")
+    def post_content(self, image_url: str, caption: str, image_key: str = None) -> bool:
         """Safe post with human-like patterns"""
         try:
             if Config.TEST_MODE:
@@ -151,22 +216,25 @@ class InstagrApiPoster:
             # Enhanced caption
             caption = self._enhance_caption(caption)
             
-            # Download image with random delay
-            self._human_delay()
-            image_path = self._download_image(image_url)
-
-            # Simulate human editing time
-            self._human_delay(2, 5)
-
-            # Upload post
-            self.client.photo_upload(
-                path=image_path,
-                caption=caption,
-                extra_data={
-                    "disable_comments": False,
-                    "like_and_view_counts_disabled": False
-                }
-            )
+            # Prefer the local copy from the image store
+            local_path = image_store.image_path(image_key) if image_key else None
+            if local_path is None:
+                # Download image with random delay
+                self._human_delay()
+
+            with prepared_image(image_url, local_path, headers=self._download_headers()) as image_path:
+                # Simulate human editing time
+                self._human_delay(2, 5)
+
+                # Upload post
+                self.session.call(lambda client: client.photo_upload(
+                    path=image_path,
+                    caption=caption,
+                    extra_data={
+                        "disable_comments": False,
+                        "like_and_view_counts_disabled": False
+                    }
+                ))
 
             # Random post-activity simulation
             if random.random() > 0.7:
@@ -176,10 +244,9 @@ class InstagrApiPoster:
 
         except Exception as e:
             logger.error(f"Post failed: {str(e)}")
+            call_failures.inc(call="instagram_post")
+            record_api_error("instagram", e)
             return False
-        finally:
-            if os.path.exists(image_path):
-                os.remove(image_path)
 
     def _enhance_caption(self, caption: str) -> str:
         """Add natural-looking variations to captions"""
@@ -189,25 +256,25 @@ class InstagrApiPoster:
     def _simulate_organic_activity(self):
         """Random account interactions"""
         actions = [
-            lambda: self.client.user_following(self.client.user_id, amount=1),
-            lambda: self.client.user_likers(self.client.user_id, amount=1),
-            lambda: self.client.user_stories(self.client.user_id, amount=1)
+            lambda client: client.user_following(client.user_id, amount=1),
+            lambda client: client.user_likers(client.user_id, amount=1),
+            lambda client: client.user_stories(client.user_id, amount=1)
         ]
-        random.choice(actions)()
+        self.session.call(random.choice(actions))
         self._human_delay(3, 7)
 
-    def _download_image(self, url: str) -> str:
-        """Download image with randomized headers"""
-        headers = {
+    def _download_headers(self) -> dict:
+        """Randomized headers for image downloads"""
+        return {
             "User-Agent": random.choice([
                 "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
                 "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15"
             ])
         }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-        temp_file.write(response.content)
-        temp_file.close()
-        return temp_file.name
\ No newline at end of file
+
+
+def create_poster():
+    """Poster for the configured INSTAGRAM_BACKEND"""
+    if Config.INSTAGRAM_BACKEND == "graph":
+        return InstagramPoster()
+    return InstagrApiPoster()
@@ -0,0 +1,239 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional
+from config import Config
+from database import get_connection, transaction
+from exceptions import TwoFactorRequired
+from locks import file_lock
+from logger import logger
+
+USER_AGENT = ("Instagram 289.0.0.30.120 Android (25/7.1.2; 380dpi; 1080x1920; unknown/Android; "
+              "realme RMX1993; RMX1993; qcom; en_US; 367216753)")
+DEVICE = {
+    "manufacturer": "realme",
+    "model": "RMX1993",
+    "android_version": 25,
+    "android_release": "7.1.2"
+}
+
+
+class AccountSession:
+    """
+    Authenticated instagrapi client for one account, shared by every
+    request and worker in the process.
+
+    Settings are read from disk once and written back only when they
+    change. All client use goes through ``lock`` since the client is
+    not thread-safe. Logins hold a file lock next to the session file, so
+    worker processes reuse a session another one just created instead of
+    logging in again.
+    """
+
+    def __init__(self, username: str, password: str, session_file: str):
+        self.username = username
+        self.password = password
+        self.session_file = session_file
+        self.lock = threading.RLock()
+        self.client = None
+        self.authenticated = False
+        self._saved = None
+        self._mtime = None
+
+    def _load(self):
+        # instagrapi is heavy to import; only load it once posting is needed
+        from instagrapi import Client
+        self.client = Client()
+        self.client.set_user_agent(USER_AGENT)
+        self.client.set_device(DEVICE)
+        if self._read_settings():
+            logger.info("Reused existing session")
+
+    def _read_settings(self) -> bool:
+        """Apply the settings on disk if they changed since last read or written; True if authenticated"""
+        try:
+            mtime = os.stat(self.session_file).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.session_file, encoding="utf-8") as f:
+                settings = json.load(f)
+            self.client.set_settings(settings)
+            self._saved = json.dumps(settings, sort_keys=True, default=str)
+            self._mtime = mtime
+            # Changed from get_user_id() to check authentication properly
+            self.authenticated = bool(self.client.user_id)
+            return self.authenticated
+        except Exception as e:
+            logger.warning(f"Session load failed: {str(e)}")
+            return False
+
+    def _process_lock(self):
+        return file_lock(f"{self.session_file}.lock")
+
+    def save(self):
+        """Atomically write the client settings if they changed since the last write"""
+        settings = json.dumps(self.client.get_settings(), sort_keys=True, default=str)
+        if settings == self._saved:
+            return
+        directory = os.path.dirname(os.path.abspath(self.session_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(settings)
+            os.replace(tmp_path, self.session_file)
+            self._saved = settings
+            self._mtime = os.stat(self.session_file).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Session save failed: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def login(self, code: Optional[str] = None) -> bool:
+        """
+        Reuse the in-memory session, logging in (or resolving 2FA) only
+        when needed. Raises TwoFactorRequired when a code must be entered.
+        """
+        with self.lock:
+            if self.client is None:
+                self._load()
+            if self.authenticated and not code:
+                return True
+
+            with self._process_lock():
+                if not code and self._read_settings():
+                    logger.info("Reused session saved by another worker")
+                    return True
+                return self._login(code)
+
+    def _login(self, code: Optional[str]) -> bool:
+        """Log in or submit a 2FA code; the caller holds both locks"""
+        from instagrapi.exceptions import ChallengeRequired
+        try:
+            time.sleep(random.uniform(1, 3))
+
+            if code:
+                # The challenge may have been hit by another worker: take its
+                # saved settings and login parameters rather than our own
+                self._read_settings()
+                params = _load_challenge(self.username) or self.client.last_login_params
+                challenge = self.client.challenge_resolve(params)
+                self.client.challenge_code(code.strip(), challenge)
+                self.authenticated = bool(self.client.user_id)
+                if self.authenticated:
+                    _clear_challenge(self.username)
+            else:
+                self.authenticated = bool(self.client.login(self.username, self.password))
+                if self.authenticated:
+                    logger.info("New login successful")
+
+            if self.authenticated:
+                self.save()
+            return self.authenticated
+
+        except ChallengeRequired as e:
+            logger.warning("2FA challenge required")
+            self.save()
+            _save_challenge(self.username, self.client.last_login_params)
+            raise TwoFactorRequired("2FA challenge required", original=e) from e
+        except Exception as e:
+            logger.error(f"Login error: {str(e)}")
+            return False
+
+    def call(self, action: Callable):
+        """Run ``action(client)`` under the lock, re-authenticating once on LoginRequired"""
+        from instagrapi.exceptions import LoginRequired
+        with self.lock:
+            if not self.login():
+                raise LoginRequired("Instagram login failed")
+            try:
+                return action(self.client)
+            except LoginRequired:
+                self.authenticated = False
+                with self._process_lock():
+                    if self._read_settings():
+                        logger.info("Instagram session expired, using the one another worker renewed")
+                    else:
+                        logger.info("Instagram session expired, logging in again")
+                        self.client.login(self.username, self.password, relogin=True)
+                        self.authenticated = True
+                        self.save()
+                return action(self.client)
+
+
+_sessions: Dict[str, AccountSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(username: Optional[str] = None, password: Optional[str] = None,
+                session_file: Optional[str] = None) -> AccountSession:
+    """Process-wide session for ``username`` (default: the configured account)"""
+    username = username or Config.INSTAGRAM_USERNAME
+    with _sessions_lock:
+        session = _sessions.get(username)
+        if session is None:
+            if username == Config.INSTAGRAM_USERNAME:
+                password = password or Config.INSTAGRAM_PASSWORD
+                session_file = session_file or Config.INSTAGRAM_SESSION_FILE
+            session = _sessions[username] = AccountSession(
+                username, password, session_file or f"instagram_session_{username}.json"
+            )
+        return session
+
+
+def _save_challenge(username: str, params: Dict):
+    """Keep the parameters of a pending login challenge for whichever worker gets the code"""
+    try:
+        with transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO two_factor_challenges (username, params, created_at) VALUES (?,?,?)",
+                (username or "", json.dumps(params or {}, default=str), time.time())
+            )
+    except sqlite3.Error as e:
+        # Only the worker that hit the challenge can resolve it then
+        logger.warning(f"2FA challenge not saved: {str(e)}")
+
+
+def _load_challenge(username: str) -> Optional[Dict]:
+    row = get_connection().execute(
+        "SELECT params FROM two_factor_challenges WHERE username = ?", (username or "",)
+    ).fetchone()
+    return json.loads(row["params"]) if row else None
+
+
+def _clear_challenge(username: str):
+    with transaction() as conn:
+        conn.execute("DELETE FROM two_factor_challenges WHERE username = ?", (username or "",))
+
+
+def store_2fa_code(code: str, username: Optional[str] = None):
+    """
+    Keep a submitted 2FA code server-side until the next login picks it
+    up, whichever worker process handles that request.
+    """
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO two_factor_codes (username, code, created_at) VALUES (?,?,?)",
+            (username or Config.INSTAGRAM_USERNAME or "", code.strip(), time.time())
+        )
+
+
+def pop_2fa_code(username: Optional[str] = None) -> Optional[str]:
+    """Take the pending 2FA code, if one was submitted within TWO_FACTOR_CODE_TTL"""
+    username = username or Config.INSTAGRAM_USERNAME or ""
+    with transaction(immediate=True) as conn:
+        row = conn.execute(
+            "SELECT code, created_at FROM two_factor_codes WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM two_factor_codes WHERE username = ?", (username,))
+    if time.time() - row["created_at"] > Config.TWO_FACTOR_CODE_TTL:
+        return None
+    return row["code"]
@@ -0,0 +1,238 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+from config import Config
+from database import get_connection, transaction
+from exceptions import DatabaseError, RunInProgress
+from logger import log_context, logger
+from checkpoints import create_run
+from pipeline import run_pipeline
+
+_wakeup = threading.Event()
+# Recorded on claimed jobs so another process can tell whether their owner is still alive
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+_workers: List[threading.Thread] = []
+_workers_lock = threading.Lock()
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["stages"] = json.loads(job["stages"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["refresh"] = bool(job["refresh"])
+    job["carousel"] = bool(job["carousel"])
+    return job
+
+
+def enqueue_job(niche: str, refresh: bool = False, run_id: Optional[str] = None,
+                carousel: bool = False) -> str:
+    """
+    Persist a new pipeline job and wake a worker; returns the job id.
+
+    With ``run_id`` the job resumes that run from its checkpoints; raises
+    RunInProgress if another job for that run is queued or running.
+    """
+    job_id = uuid.uuid4().hex
+    try:
+        # IMMEDIATE so two concurrent resumes can't both see no active job
+        with transaction(immediate=run_id is not None) as conn:
+            if run_id is not None and _has_active_job(conn, run_id):
+                raise RunInProgress(f"Run {run_id} already has a queued or running job")
+            conn.execute(
+                '''INSERT INTO jobs (id, niche, refresh, carousel, status, stages, created_at, run_id)
+                   VALUES (?,?,?,?,?,?,?,?)''',
+                (job_id, niche, int(refresh), int(carousel), "queued", "{}", time.time(), run_id)
+            )
+        logger.info(f"Queued job {job_id} for niche: {niche}")
+
+    except sqlite3.Error as e:
+        logger.error(f"Job enqueue failed: {str(e)}")
+        raise DatabaseError("Failed to queue job") from e
+
+    _wakeup.set()
+    return job_id
+
+
+def _has_active_job(conn: sqlite3.Connection, run_id: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM jobs WHERE run_id = ? AND status IN ('queued', 'running') LIMIT 1", (run_id,)
+    ).fetchone()
+    return row is not None
+
+
+def has_active_job(run_id: str) -> bool:
+    try:
+        return _has_active_job(get_connection(), run_id)
+    except sqlite3.Error as e:
+        logger.error(f"Job lookup failed: {str(e)}")
+        raise DatabaseError("Failed to load jobs") from e
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    try:
+        row = get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    except sqlite3.Error as e:
+        logger.error(f"Job lookup failed: {str(e)}")
+        raise DatabaseError("Failed to load job") from e
+
+
+def queue_stats() -> Dict:
+    """Number of jobs per status"""
+    try:
+        rows = get_connection().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall()
+        return {status: count for status, count in rows}
+
+    except sqlite3.Error as e:
+        logger.error(f"Job stats failed: {str(e)}")
+        raise DatabaseError("Failed to load job stats") from e
+
+
+def _claim_next() -> Optional[Dict]:
+    """Atomically move the oldest queued job to running"""
+    # IMMEDIATE takes the write lock up front so two workers can't claim the same job
+    with transaction(immediate=True) as conn:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET status = 'running', started_at = ?, worker = ? WHERE id = ?",
+            (time.time(), WORKER_ID, row["id"])
+        )
+        return _row_to_job(row)
+
+
+def _update_job(job_id: str, **fields):
+    if "stages" in fields:
+        fields["stages"] = json.dumps(fields["stages"])
+    if "result" in fields:
+        fields["result"] = json.dumps(fields["result"])
+
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with transaction() as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _run_job(job: Dict, poster_factory: Optional[Callable]):
+    job_id = job["id"]
+    stages = {}
+
+    def on_stage(stage: str, status: str, elapsed: Optional[float]):
+        entry = stages.setdefault(stage, {})
+        entry["status"] = status
+        if status == "started":
+            entry["started_at"] = time.time()
+        else:
+            entry["duration"] = round(elapsed, 3)
+        try:
+            _update_job(job_id, stage=stage, stages=stages)
+        except sqlite3.Error as e:
+            # Progress reporting must not fail the pipeline itself
+            logger.warning(f"Job progress update failed: {str(e)}")
+
+    logger.info(f"Running job {job_id}")
+    try:
+        # Record the run up front so a re-queued job resumes it after a restart
+        run_id = job["run_id"]
+        if run_id is None:
+            run_id = create_run(job["niche"])
+            _update_job(job_id, run_id=run_id)
+
+        poster = poster_factory() if poster_factory else None
+        result = run_pipeline(job["niche"], poster=poster, refresh=job["refresh"],
+                              on_stage=on_stage, run_id=run_id, carousel=job["carousel"])
+        _update_job(job_id, status="completed", result=result, finished_at=time.time())
+        logger.info(f"Job {job_id} completed in {result['time_taken']}")
+
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+
+
+def _worker_loop(poster_factory: Optional[Callable]):
+    while True:
+        # Clear before claiming so an enqueue during the claim isn't missed
+        _wakeup.clear()
+        try:
+            job = _claim_next()
+        except sqlite3.Error as e:
+            logger.error(f"Job claim failed: {str(e)}")
+            job = None
+
+        if job is None:
+            _wakeup.wait(Config.JOB_POLL_INTERVAL)
+            continue
+
+        with log_context(job_id=job["id"]):
+            _run_job(job, poster_factory)
+
+
+def _is_orphaned(worker: Optional[str]) -> bool:
+    """
+    True if the process that claimed a job has exited. Workers are
+    expected on one host (the database is a local SQLite file), so a job
+    claimed under another hostname belongs to a previous container.
+    """
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    if int(pid) == os.getpid() or os.name == "nt":
+        # Left by an earlier process that had our pid; this one hasn't claimed anything
+        # yet. On Windows (single process only) os.kill would terminate the pid instead.
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # Alive, but owned by another user
+        pass
+    return False
+
+
+def requeue_orphaned_jobs() -> int:
+    """Re-queue running jobs whose worker process has exited"""
+    with transaction(immediate=True) as conn:
+        rows = conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall()
+        orphaned = [(row["id"],) for row in rows if _is_orphaned(row["worker"])]
+        conn.executemany(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL WHERE id = ?", orphaned
+        )
+    return len(orphaned)
+
+
+def start_workers(poster_factory: Optional[Callable] = None, count: Optional[int] = None):
+    """
+    Start the background worker pool.
+
+    Jobs left running by a process that has since exited are re-queued
+    first; jobs of sibling worker processes are left alone.
+    ``poster_factory`` returns a logged-in poster for each job, or None
+    to only save posts.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+
+        requeued = requeue_orphaned_jobs()
+        if requeued:
+            logger.info(f"Re-queued {requeued} interrupted jobs")
+
+        for i in range(count or Config.JOB_WORKERS):
+            worker = threading.Thread(
+                target=_worker_loop, args=(poster_factory,), name=f"job-worker-{i}", daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
+        logger.info(f"Started {len(_workers)} job workers")
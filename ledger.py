@@ -0,0 +1,150 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import Config
+from database import get_connection, transaction
+from exceptions import BudgetExceeded, DatabaseError, ValidationError
+from logger import current_log_context, logger
+
+GROUPINGS = {
+    "niche": "COALESCE(niche, '')",
+    "day": "date(created_at, 'unixepoch', 'localtime')",
+    "stage": "COALESCE(stage, '')",
+    "model": "COALESCE(model, '')"
+}
+
+
+def _parse_prices(text: str) -> Dict[str, Tuple[float, float]]:
+    prices = {}
+    for item in filter(None, text.split(",")):
+        model, _, rates = item.partition("=")
+        prompt, _, completion = rates.partition("/")
+        try:
+            prices[model.strip()] = (float(prompt), float(completion or prompt))
+        except ValueError:
+            pass
+    return prices
+
+
+_prices = _parse_prices(Config.OPENAI_PRICES)
+
+
+def token_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """USD for a completion call; unknown models cost 0"""
+    prompt_rate, completion_rate = _prices.get(model or "", (0.0, 0.0))
+    return (prompt_tokens * prompt_rate + completion_tokens * completion_rate) / 1000.0
+
+
+def record_call(provider: str, model: Optional[str], stage: str, outcome: str,
+                latency: Optional[float] = None, prompt_tokens: int = 0,
+                completion_tokens: int = 0, cost: Optional[float] = None,
+                context: Optional[Dict] = None):
+    """
+    Add one provider call to the ledger. ``run_id`` and ``niche`` come
+    from ``context`` (default: the current log context).
+    """
+    if not Config.LEDGER_ENABLED:
+        return
+    context = current_log_context() if context is None else context
+    if cost is None:
+        if provider == "replicate":
+            # Billed by prediction time; wall time is the closest estimate without metrics
+            cost = (latency or 0.0) * Config.REPLICATE_COST_PER_SECOND
+        else:
+            cost = token_cost(model, prompt_tokens, completion_tokens)
+    try:
+        with transaction() as conn:
+            conn.execute(
+                '''INSERT INTO ledger (run_id, niche, provider, model, stage, prompt_tokens,
+                                       completion_tokens, latency, cost, outcome, created_at)
+                   VALUES (?,?,?,?,?,?,?,?,?,?,?)''',
+                (context.get("run_id"), context.get("niche"), provider, model, stage,
+                 prompt_tokens, completion_tokens, latency, cost, outcome, time.time())
+            )
+    except sqlite3.Error as e:
+        # Accounting must never fail the call it describes
+        logger.warning(f"Ledger write failed: {str(e)}")
+
+
+@contextmanager
+def metered(provider: str, model: Optional[str], stage: str) -> Iterator[Dict]:
+    """
+    Time the block and record it on exit, as ``ok`` or the exception's
+    type. The block fills in ``prompt_tokens``/``completion_tokens``
+    (or ``cost``) on the yielded dict once the response is known.
+    """
+    entry = {"prompt_tokens": 0, "completion_tokens": 0, "cost": None}
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield entry
+    except Exception as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        record_call(provider, model, stage, outcome, time.perf_counter() - start,
+                    entry["prompt_tokens"], entry["completion_tokens"], entry["cost"])
+
+
+def add_usage(entry: Dict, usage):
+    """Copy an OpenAI ``usage`` object onto a metered entry"""
+    if usage is not None:
+        entry["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        entry["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+
+
+def run_cost(run_id: str) -> float:
+    """Recorded USD spent by a run so far"""
+    try:
+        row = get_connection().execute(
+            "SELECT COALESCE(SUM(cost), 0) FROM ledger WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        return row[0]
+    except sqlite3.Error as e:
+        logger.warning(f"Run cost lookup failed: {str(e)}")
+        return 0.0
+
+
+def check_budget(run_id: str, budget: Optional[float] = None):
+    """Raise BudgetExceeded once ``run_id`` has spent more than ``budget`` (default RUN_BUDGET)"""
+    budget = Config.RUN_BUDGET if budget is None else budget
+    if not budget or not Config.LEDGER_ENABLED:
+        return
+    spent = run_cost(run_id)
+    if spent > budget:
+        raise BudgetExceeded(f"Run {run_id} spent ${spent:.4f}, over its ${budget:.4f} budget")
+
+
+def ledger_summary(by: str = "niche", since: Optional[float] = None,
+                   run_id: Optional[str] = None) -> List[Dict]:
+    """
+    Calls, tokens, cost, latency and errors grouped by ``by`` (niche, day,
+    stage or model), most expensive first.
+    """
+    if by not in GROUPINGS:
+        raise ValidationError(f"Cannot group ledger by {by}")
+
+    query = f'''SELECT {GROUPINGS[by]} AS {by},
+                       COUNT(*) AS calls,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(completion_tokens) AS completion_tokens,
+                       ROUND(SUM(cost), 6) AS cost,
+                       ROUND(AVG(latency), 3) AS avg_latency,
+                       ROUND(MAX(latency), 3) AS max_latency,
+                       SUM(outcome != 'ok') AS errors
+                FROM ledger WHERE 1 = 1'''
+    params = []
+    if since is not None:
+        query += " AND created_at >= ?"
+        params.append(since)
+    if run_id is not None:
+        query += " AND run_id = ?"
+        params.append(run_id)
+    query += f" GROUP BY {by} ORDER BY cost DESC, calls DESC"
+
+    try:
+        return [dict(row) for row in get_connection().execute(query, params)]
+    except sqlite3.Error as e:
+        logger.error(f"Ledger summary failed: {str(e)}")
+        raise DatabaseError("Failed to summarize ledger") from e
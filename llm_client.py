@@ -0,0 +1,78 @@
+import atexit
+import threading
+from typing import TYPE_CHECKING
+from config import Config
+from logger import logger
+from metrics import record_api_error, record_retry
+
+# httpx and openai are imported on first use to keep startup cheap
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI
+
+_lock = threading.Lock()
+_client = None
+
+
+def _timeout() -> "httpx.Timeout":
+    import httpx
+    return httpx.Timeout(
+        Config.OPENAI_READ_TIMEOUT,
+        connect=Config.OPENAI_CONNECT_TIMEOUT
+    )
+
+
+def _limits() -> "httpx.Limits":
+    import httpx
+    return httpx.Limits(
+        max_connections=Config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=Config.OPENAI_KEEPALIVE_EXPIRY
+    )
+
+
+def _on_request(request: "httpx.Request"):
+    # The SDK numbers its own retries in this header
+    if int(request.headers.get("x-stainless-retry-count", "0") or 0) > 0:
+        record_retry("openai")
+
+
+def _on_response(response: "httpx.Response"):
+    if response.status_code >= 400:
+        record_api_error("openai", response.status_code)
+
+
+def get_openai_client() -> "OpenAI":
+    """Return the process-wide OpenAI client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+                logger.debug("Creating shared OpenAI client")
+                _client = OpenAI(
+                    api_key=Config.OPENAI_API_KEY,
+                    base_url=Config.OPENAI_BASE_URL,
+                    timeout=_timeout(),
+                    max_retries=Config.OPENAI_MAX_RETRIES,
+                    http_client=httpx.Client(
+                        timeout=_timeout(),
+                        limits=_limits(),
+                        event_hooks={"request": [_on_request], "response": [_on_response]}
+                    )
+                )
+    return _client
+
+
+def close_client():
+    """Close the pooled connections of the shared client"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+# Release pooled keep-alive connections on interpreter exit
+atexit.register(close_client)
@@ -1,7 +1,38 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
 import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict
 from config import Config
 
+# Fields such as run_id, job_id and stage attached to every record logged
+# in the current context (thread, or task copied into an executor)
+_log_context: ContextVar[Dict] = ContextVar("log_context", default={})
+
+CONTEXT_FIELDS = ("job_id", "run_id", "stage", "niche")
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach ``fields`` to every record logged inside the block"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def current_log_context() -> Dict:
+    """The fields attached by the enclosing log_context blocks"""
+    return dict(_log_context.get())
+
+
 class UnicodeStreamHandler(logging.StreamHandler):
     def emit(self, record):
         try:
@@ -15,16 +46,109 @@ class UnicodeStreamHandler(logging.StreamHandler):
             stream.write(msg + self.terminator)
             self.flush()
 
+
+class ContextFilter(logging.Filter):
+    """Copy the current log context onto the record, in the logging thread"""
+
+    def filter(self, record):
+        for name, value in _log_context.get().items():
+            setattr(record, name, value)
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Keep only a fraction of DEBUG records, per source module (e.g. ``predictions``)"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        # Every module shares the one "logger" logger, so the module tells sources apart
+        rate = self.rates.get(record.module, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        context = " ".join(f"{name}={getattr(record, name)}" for name in CONTEXT_FIELDS
+                           if getattr(record, name, None) is not None)
+        return f"{line} [{context}]" if context else line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: records are dropped (and counted) when the queue is full"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def _parse_rates(text: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, text.split(",")):
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            pass
+    return rates
+
+
+_listener = None
+
+
 def configure_logger():
+    global _listener
     logger = logging.getLogger(__name__)
     logger.setLevel(Config.LOG_LEVEL)
-    
-    handler = UnicodeStreamHandler(sys.stdout)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Root handlers (e.g. basicConfig) would write every record again, synchronously
+    logger.propagate = False
+
+    handler = UnicodeStreamHandler(sys.stderr if Config.LOG_STREAM == "stderr" else sys.stdout)
+    if Config.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = TextFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     handler.setFormatter(formatter)
-    
+
+    if Config.LOG_ASYNC:
+        # Formatting and stdout writes happen on the listener thread
+        log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        handler = DroppingQueueHandler(log_queue)
+
+    handler.addFilter(DebugSampler(_parse_rates(Config.LOG_DEBUG_SAMPLING)))
+    handler.addFilter(ContextFilter())
     logger.addHandler(handler)
     return logger
 
 # Create and configure the logger
-logger = configure_logger()
\ No newline at end of file
+logger = configure_logger()
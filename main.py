@@ -1,20 +1,113 @@
-import logging
-from agents.research_agent import research_agent
-from agents.content_planner import content_planner
-from agents.image_generator import generate_image
-from agents.caption_generator import generate_caption
-from database import init_db, save_post
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Dict, Iterator, Optional
+from database import init_db
+from logger import logger
+from metrics import percentile
+from pipeline import run_pipeline
 
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+def _read_niches(path: str) -> Iterator[str]:
+    """One niche per line; blank lines and '#' comments are skipped"""
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in source:
+            niche = line.strip()
+            if niche and not niche.startswith("#"):
+                yield niche
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def run_batch(path: str, output: str, parallel: int, num_posts: int = 2,
+              budget: Optional[float] = None) -> Dict:
+    """
+    Run the pipeline for every niche in ``path`` (or stdin for ``-``),
+    ``parallel`` niches at a time. Each result is appended to the JSONL
+    ``output`` as soon as its niche finishes.
+    """
+    latencies = []
+    totals = {"niches": 0, "succeeded": 0, "failed": 0, "posts": 0, "failed_posts": 0, "cost": 0.0}
+    lock = threading.Lock()
+
+    def process(niche: str, out):
+        start = time.perf_counter()
+        try:
+            result = run_pipeline(niche, num_posts=num_posts, budget=budget)
+            record = {"niche": niche, "status": "completed", **result}
+        except Exception as e:
+            logger.error(f"Batch niche '{niche}' failed: {str(e)}")
+            record = {"niche": niche, "status": "failed", "error": str(e)}
+        elapsed = time.perf_counter() - start
+        record["seconds"] = round(elapsed, 3)
+
+        with lock:
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            latencies.append(elapsed)
+            totals["niches"] += 1
+            if record["status"] == "completed":
+                totals["succeeded"] += 1
+                totals["posts"] += len(record["posts"])
+                totals["failed_posts"] += len(record["failed_posts"])
+                totals["cost"] += record["cost"]
+            else:
+                totals["failed"] += 1
+            logger.info(f"[{totals['niches']}] {niche}: {record['status']} in {elapsed:.1f}s")
+
+    wall_start = time.perf_counter()
+    with open(output, "a", encoding="utf-8") as out:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            # Bounded submission so a huge niche list is not queued up front
+            pending = set()
+            for niche in _read_niches(path):
+                if len(pending) >= parallel * 2:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(executor.submit(copy_context().run, process, niche, out))
+    wall = time.perf_counter() - wall_start
+
+    return dict(totals,
+                cost=round(totals["cost"], 6),
+                wall_seconds=round(wall, 3),
+                niches_per_minute=round(totals["niches"] / wall * 60, 2) if wall else 0.0,
+                posts_per_minute=round(totals["posts"] / wall * 60, 2) if wall else 0.0,
+                latency_p50=round(percentile(latencies, 50), 3),
+                latency_p95=round(percentile(latencies, 95), 3),
+                latency_max=round(max(latencies), 3) if latencies else 0.0)
+
 
 def main():
     """Main CLI workflow"""
+    parser = argparse.ArgumentParser(description="AI Influencer Creator")
+    parser.add_argument("--resume", metavar="RUN_ID", help="resume an interrupted run from its checkpoints")
+    parser.add_argument("--list-runs", action="store_true", help="list runs that can be resumed and exit")
+    parser.add_argument("--batch", metavar="FILE", help="process every niche in FILE ('-' for stdin) non-interactively")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file batch results are appended to")
+    parser.add_argument("--parallel", type=int, default=4, help="niches processed at once in batch mode")
+    parser.add_argument("--num-posts", type=int, default=2, help="posts planned per niche in batch mode")
+    parser.add_argument("--budget", type=float, help="abort a run once it has spent this many USD (default RUN_BUDGET)")
+    args = parser.parse_args()
+
+    if args.list_runs:
+        from checkpoints import list_unfinished_runs, run_is_active
+        init_db()
+        for run in list_unfinished_runs():
+            if not run_is_active(run):
+                print(f"{run['id']}  {run['status']:<10}  {run['niche']}")
+        return
+
+    if args.batch:
+        init_db()
+        summary = run_batch(args.batch, args.output, max(1, args.parallel), args.num_posts, args.budget)
+        print(json.dumps(summary, indent=2), file=sys.stderr)
+        return
+
     print("\n=== AI Influencer Creator ===")
     try:
         init_db()  # Should run FIRST before anything else
@@ -24,28 +117,41 @@ def main():
         return
 
     try:
-        print("\n=== AI Influencer Creator ===")
-        niche = input("Enter your niche/topic: ").strip()
-        
-        logger.info("Starting research phase...")
-        research = research_agent(niche)
-        
-        logger.info("Planning content...")
-        plan = content_planner(research)
+        if args.resume:
+            from checkpoints import get_run, run_is_active
+            from jobs import has_active_job
+            run = get_run(args.resume)
+            if run is None:
+                print(f"Unknown run: {args.resume}")
+                return
+            if run["status"] == "completed":
+                print(f"Run {args.resume} already completed")
+                return
+            if run_is_active(run) or has_active_job(args.resume):
+                print(f"Run {args.resume} is still in progress")
+                return
+            niche = run["niche"]
+            print(f"Resuming run {args.resume} for niche: {niche}")
+        else:
+            niche = input("Enter your niche/topic: ").strip()
         
-        print("\n=== Generated Plan ===")
-        for i, post in enumerate(plan["content_plan"], 1):
-            print(f"\nPost {i}: {post}")
-            
-            logger.info(f"Generating assets for Post {i}")
-            image_url = generate_image(post)
-            caption = generate_caption(post)
-            
-            print(f"\nImage URL: {image_url}")
-            print(f"Caption:\n{caption}")
+        logger.info("Running pipeline (research, planning, generation, saving)...")
+        result = run_pipeline(niche, run_id=args.resume, budget=args.budget)
+
+        print("\n=== Generated Posts ===")
+        for i, post in enumerate(result["posts"], 1):
+            print(f"\nPost {i}")
+            print(f"\nImage URL: {post['image']}")
+            if post["image_key"]:
+                print(f"Stored as: {post['image_key']}")
+            print(f"Caption:\n{post['caption']}")
+
+        for failure in result["failed_posts"]:
+            print(f"\nGeneration failed: {failure.get('error', 'posting failed')}")
 
-            save_post(niche, post, image_url, caption)
-            print("post_saved in db")
+        print(f"{len(result['posts'])} posts saved in db (provider cost ${result['cost']:.4f})")
+        if result["failed_posts"]:
+            print(f"Resume with: python main.py --resume {result['run_id']}")
             
         print("\n=== Process Complete ===")
         print("Check 'outputs/' directory for generated files")
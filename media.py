@@ -0,0 +1,135 @@
+import atexit
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from config import Config
+from exceptions import APIError
+from logger import logger
+
+# Instagram feed images must be between 4:5 (portrait) and 1.91:1 (landscape)
+MIN_ASPECT = 4 / 5
+MAX_ASPECT = 1.91
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def download_to_temp(url: str, headers: Optional[Dict] = None, suffix: str = ".jpg") -> str:
+    """Stream ``url`` to a temp file in chunks; the file is removed if the download fails"""
+    import requests
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=(5, 60)) as response:
+            response.raise_for_status()
+            with os.fdopen(fd, "wb") as f:
+                fd = None
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+        return path
+    except Exception as e:
+        if fd is not None:
+            os.close(fd)
+        os.remove(path)
+        logger.error(f"Image download failed: {str(e)}")
+        raise APIError("Failed to download image") from e
+
+
+def normalize_image(source: str, destination: str, max_width: int, quality: int, max_bytes: int) -> str:
+    """
+    Center-crop ``source`` into Instagram's aspect ratio range, cap its
+    width and re-encode it as JPEG at ``destination``.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    from PIL import Image, ImageOps
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        width, height = image.size
+        aspect = width / height
+        if aspect < MIN_ASPECT:
+            crop = int(width / MIN_ASPECT)
+            top = (height - crop) // 2
+            image = image.crop((0, top, width, top + crop))
+        elif aspect > MAX_ASPECT:
+            crop = int(height * MAX_ASPECT)
+            left = (width - crop) // 2
+            image = image.crop((left, 0, left + crop, height))
+
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+
+        # Step quality down until the file fits the upload cap
+        while True:
+            image.save(destination, "JPEG", quality=quality, optimize=True, progressive=True)
+            if os.path.getsize(destination) <= max_bytes or quality <= 50:
+                return destination
+            quality -= 10
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Forking this multi-threaded process could copy locks held by
+                # other threads into the child; start workers from a clean process
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(max_workers=Config.MEDIA_WORKERS,
+                                            mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+# Stop the resize workers before the interpreter tears down
+atexit.register(shutdown_pool)
+
+
+@contextmanager
+def prepared_image(image_url: str, local_path: Optional[str] = None,
+                   headers: Optional[Dict] = None) -> Iterator[str]:
+    """
+    Yield the path of an upload-ready copy of an image.
+
+    ``local_path`` (e.g. from the image store) is used instead of
+    downloading when given. Resizing runs in a process pool so CPU work
+    never blocks the posting threads. If normalization fails the
+    original image is yielded. Every temp file is removed on exit.
+    """
+    temp_files = []
+    try:
+        source = local_path
+        if source is None:
+            source = download_to_temp(image_url, headers=headers)
+            temp_files.append(source)
+
+        fd, destination = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+        temp_files.append(destination)
+        try:
+            path = _get_pool().submit(
+                normalize_image, source, destination,
+                Config.MEDIA_MAX_WIDTH, Config.MEDIA_JPEG_QUALITY, Config.MEDIA_MAX_BYTES
+            ).result()
+        except Exception as e:
+            logger.warning(f"Image normalization failed, uploading original: {str(e)}")
+            path = source
+
+        yield path
+
+    finally:
+        for temp_file in temp_files:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
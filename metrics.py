@@ -0,0 +1,165 @@
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Seconds; generation calls routinely take tens of seconds
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            # [per-bucket counts..., sum, count]
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labels, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+call_seconds = Histogram(
+    "ai_influencer_call_seconds", "Latency of agent, database and posting calls", ["call"]
+)
+call_failures = Counter(
+    "ai_influencer_call_failures_total", "Calls that raised or reported failure", ["call"]
+)
+stage_seconds = Histogram(
+    "ai_influencer_pipeline_stage_seconds", "Latency of whole pipeline stages", ["stage"]
+)
+api_errors = Counter(
+    "ai_influencer_provider_errors_total", "Error responses from external providers", ["provider", "status"]
+)
+api_retries = Counter(
+    "ai_influencer_provider_retries_total", "Retried requests to external providers", ["provider"]
+)
+research_cache_lookups = Counter(
+    "ai_influencer_research_cache_lookups_total", "Research cache lookups by outcome", ["result"]
+)
+prompt_tokens = Histogram(
+    "ai_influencer_prompt_tokens", "Input tokens per rendered prompt", ["template"],
+    buckets=(25, 50, 100, 200, 400, 800, 1600, 3200)
+)
+
+REGISTRY = [call_seconds, call_failures, stage_seconds, api_errors, api_retries,
+            research_cache_lookups, prompt_tokens]
+
+
+@contextmanager
+def span(call: str):
+    """Time a block into ``call_seconds`` and count it as failed if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        call_failures.inc(call=call)
+        raise
+    finally:
+        call_seconds.observe(time.perf_counter() - start, call=call)
+
+
+def timed(call: str):
+    """Decorator form of :func:`span`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(call):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_api_error(provider: str, error=None):
+    """Count a provider error, labelled with its HTTP status when known"""
+    status = error if isinstance(error, int) else (
+        getattr(error, "status_code", None) or getattr(error, "status", None) or "error"
+    )
+    api_errors.inc(provider=provider, status=status)
+
+
+def record_retry(provider: str):
+    api_retries.inc(provider=provider)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of raw samples"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def render_prometheus() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
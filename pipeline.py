@@ -0,0 +1,495 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import copy_context
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from agents.research_agent import iter_research, research_agent
+from agents.content_planner import content_planner
+from agents.image_generator import generate_image, submit_image
+from agents.caption_generator import generate_caption
+from checkpoints import RunCheckpoints, create_run, finish_run, mark_run_running
+from config import Config
+from database import save_post, save_posts
+from exceptions import DatabaseError
+from image_store import store_image
+from ledger import check_budget, run_cost
+from logger import log_context, logger
+from metrics import stage_seconds
+
+# on_stage(stage, status, elapsed) is called with "started", "completed", "failed"
+# or "skipped" (output restored from a checkpoint)
+StageCallback = Callable[[str, str, Optional[float]], None]
+
+
+@contextmanager
+def _stage(name: str, on_stage: Optional[StageCallback]):
+    """Report the start, end and duration of a pipeline stage"""
+    if on_stage:
+        on_stage(name, "started", None)
+    start = time.perf_counter()
+    try:
+        with log_context(stage=name):
+            yield
+    except Exception:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        if on_stage:
+            on_stage(name, "failed", elapsed)
+        raise
+    elapsed = time.perf_counter() - start
+    stage_seconds.observe(elapsed, stage=name)
+    if on_stage:
+        on_stage(name, "completed", elapsed)
+
+
+def _skipped(name: str, on_stage: Optional[StageCallback]):
+    if on_stage:
+        on_stage(name, "skipped", 0.0)
+
+
+def _done_future(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _generate_image(idea: str) -> Dict:
+    """Generate an image and keep a local copy in the image store"""
+    return _store_generated(generate_image(idea))
+
+
+def _store_generated(image_url: str) -> Dict:
+    image_key = None
+    if not Config.TEST_MODE:
+        try:
+            image_key = store_image(image_url)
+        except Exception as e:
+            # The remote URL still works for now, so don't drop the post
+            logger.warning(f"Keeping remote image only: {str(e)}")
+    return {"url": image_url, "key": image_key}
+
+
+def _start_image(executor: ThreadPoolExecutor, idea: str) -> Future:
+    """
+    Future of ``{"url", "key"}`` for an idea's image.
+
+    With the async backend a worker thread is only used to submit the
+    prediction and later to store the result, not while it runs.
+    """
+    if Config.IMAGE_BACKEND != "async":
+        return executor.submit(copy_context().run, _generate_image, idea)
+
+    result = Future()
+    context = copy_context()
+
+    def settle(source: Future):
+        try:
+            result.set_result(source.result())
+        except Exception as e:
+            result.set_exception(e)
+
+    def on_output(prediction: Future):
+        try:
+            stored = executor.submit(context.copy().run, _store_generated, prediction.result()[0])
+            stored.add_done_callback(settle)
+        except Exception as e:
+            # Prediction failed, or the executor was shut down meanwhile
+            result.set_exception(e)
+
+    def on_submitted(submitted: Future):
+        try:
+            submitted.result().add_done_callback(on_output)
+        except Exception as e:
+            result.set_exception(e)
+
+    executor.submit(context.copy().run, submit_image, idea).add_done_callback(on_submitted)
+    return result
+
+
+def _collect(idea: str, image_future: Future, caption_future: Future) -> Dict:
+    """Combine an idea's finished futures into an asset or an error entry"""
+    try:
+        image = image_future.result()
+        return {
+            "idea": idea,
+            "image": image["url"],
+            "image_key": image["key"],
+            "caption": caption_future.result()
+        }
+    except Exception as e:
+        logger.error(f"Error processing idea: {str(e)}")
+        return {"idea": idea, "error": str(e)}
+
+
+def iter_assets(ideas: List[str], max_workers: Optional[int] = None,
+                known: Optional[Dict[int, Dict]] = None,
+                on_part: Optional[Callable[[int, str, object], None]] = None) -> Iterator[Tuple[int, Dict]]:
+    """
+    Generate images and captions concurrently, yielding ``(index, asset)``
+    as soon as both parts of an idea are finished.
+
+    ``known`` maps an idea index to already generated ``image``/``caption``
+    parts, which are reused instead of regenerated; a part may also be a
+    Future already started elsewhere. ``on_part(index, kind, value)`` is
+    called as each newly generated part succeeds.
+    """
+    if not ideas:
+        return
+
+    workers = max_workers or Config.PIPELINE_MAX_WORKERS
+    logger.info(f"Generating assets for {len(ideas)} ideas with {workers} workers")
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="assets")
+    try:
+        known = known or {}
+        owners = {}
+        fresh = {}
+        pairs = []
+        for index, idea in enumerate(ideas):
+            parts = known.get(index, {})
+            if isinstance(parts.get("image"), Future):
+                image_future = parts["image"]
+                fresh[image_future] = "image"
+            elif "image" in parts:
+                image_future = _done_future(parts["image"])
+            else:
+                # Each task runs in a copy of the caller's context so its logs keep run/stage ids
+                image_future = _start_image(executor, idea)
+                fresh[image_future] = "image"
+            if isinstance(parts.get("caption"), Future):
+                caption_future = parts["caption"]
+                fresh[caption_future] = "caption"
+            elif "caption" in parts:
+                caption_future = _done_future(parts["caption"])
+            else:
+                caption_future = executor.submit(copy_context().run, generate_caption, idea)
+                fresh[caption_future] = "caption"
+            owners[image_future] = owners[caption_future] = index
+            pairs.append((image_future, caption_future))
+
+        remaining = [2] * len(ideas)
+        for future in as_completed(owners):
+            index = owners[future]
+            if on_part and future in fresh and future.exception() is None:
+                on_part(index, fresh[future], future.result())
+            remaining[index] -= 1
+            if remaining[index] == 0:
+                yield index, _collect(ideas[index], *pairs[index])
+    finally:
+        # Don't keep generating if the consumer stops early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_assets(ideas: List[str], max_workers: Optional[int] = None,
+                    known: Optional[Dict[int, Dict]] = None,
+                    on_part: Optional[Callable[[int, str, object], None]] = None) -> List[Dict]:
+    """
+    Generate images and captions for all ideas concurrently.
+
+    Results are returned in plan order. Each entry holds either
+    ``image``, ``image_key`` and ``caption`` or an ``error`` message
+    for that idea.
+    """
+    results = [None] * len(ideas)
+    for index, asset in iter_assets(ideas, max_workers=max_workers, known=known, on_part=on_part):
+        results[index] = asset
+    return results
+
+
+def process_plan(niche: str, ideas: List[str], poster=None, max_workers: Optional[int] = None,
+                 on_stage: Optional[StageCallback] = None, run: Optional[RunCheckpoints] = None,
+                 early: Optional[Dict[int, Dict]] = None, budget: Optional[float] = None,
+                 carousel: bool = False):
+    """
+    Generate assets concurrently, then save and post them in plan order.
+
+    Returns ``(posts, failed_posts)``. When ``poster`` is None the posts
+    are only saved. With ``carousel`` and a poster that supports it, the
+    images go out as one carousel post under the first idea's caption.
+    With ``run``, every generated image and caption, save and successful
+    post is checkpointed, and checkpointed work is reused. ``early`` maps
+    idea indexes to image/caption futures started during research. With
+    ``run``, BudgetExceeded is raised as soon as the run's recorded
+    provider cost passes ``budget`` (default RUN_BUDGET).
+    """
+    posts = []
+    failed_posts = []
+
+    known = {}
+    if run:
+        for index in range(len(ideas)):
+            parts = {kind: run.get(kind, index) for kind in ("image", "caption")}
+            known[index] = {kind: value for kind, value in parts.items() if value is not None}
+    for index, futures in (early or {}).items():
+        if index < len(ideas) and futures["idea"] == ideas[index]:
+            for kind in ("image", "caption"):
+                known.setdefault(index, {}).setdefault(kind, futures[kind])
+
+    def on_part(index: int, kind: str, value):
+        if run:
+            run.save(kind, value, index)
+            check_budget(run.run_id, budget)
+
+    with _stage("generation", on_stage):
+        assets = generate_assets(ideas, max_workers=max_workers, known=known, on_part=on_part)
+
+    ready = []
+    for index, asset in enumerate(assets):
+        if "error" in asset:
+            failed_posts.append({"error": asset["error"]})
+        else:
+            ready.append((index, asset))
+
+    if run:
+        check_budget(run.run_id, budget)
+
+    with _stage("saving", on_stage):
+        unsaved = [(index, asset) for index, asset in ready if not (run and run.get("saved", index))]
+        try:
+            # One transaction for the whole plan
+            save_posts([{
+                "niche": niche,
+                "post_idea": asset["idea"],
+                "image_url": asset["image"],
+                "caption": asset["caption"],
+                "image_key": asset["image_key"]
+            } for _, asset in unsaved])
+            if run:
+                for index, _ in unsaved:
+                    run.save("saved", True, index)
+        except DatabaseError as e:
+            failed_posts.extend({"error": str(e)} for _ in ready)
+            ready = []
+
+    with _stage("publishing", on_stage):
+        batched = {}
+        pending = [(index, asset) for index, asset in ready if not (run and run.get("post", index))]
+        if carousel and poster is not None:
+            if not hasattr(poster, "post_carousel"):
+                logger.warning("Poster has no carousel support, publishing posts one by one")
+            elif len(pending) >= 2:
+                # Instagram allows 10 images per carousel; any others are posted singly
+                album, pending = pending[:10], pending[10:]
+                try:
+                    ok = poster.post_carousel([asset["image"] for _, asset in album], album[0][1]["caption"])
+                except Exception as e:
+                    logger.error(f"Carousel publishing failed: {str(e)}")
+                    ok = False
+                batched = {index: ok for index, _ in album}
+        if hasattr(poster, "post_batch"):
+            # Graph API: create and await all containers at once, publish in order
+            if pending:
+                try:
+                    flags = poster.post_batch([
+                        {"image_url": asset["image"], "caption": asset["caption"]} for _, asset in pending
+                    ])
+                    batched.update({index: ok for (index, _), ok in zip(pending, flags)})
+                except Exception as e:
+                    logger.error(f"Batch publishing failed: {str(e)}")
+                    batched.update({index: False for index, _ in pending})
+
+        for index, asset in ready:
+            idea, image_url, caption = asset["idea"], asset["image"], asset["caption"]
+            image_key = asset["image_key"]
+            result = {"image": image_url, "image_key": image_key, "caption": caption}
+
+            if run and run.get("post", index):
+                # Already published before an interruption
+                posts.append(run.get("post", index))
+                continue
+
+            if index in batched:
+                if batched[index]:
+                    posts.append(result)
+                    if run:
+                        run.save("post", result, index)
+                else:
+                    failed_posts.append(result)
+                    logger.warning(f"Failed to post: {idea}")
+                continue
+
+            try:
+                if poster is None or poster.post_content(image_url, caption, image_key=image_key):
+                    posts.append(result)
+                    if run:
+                        run.save("post", result, index)
+                else:
+                    failed_posts.append(result)
+                    logger.warning(f"Failed to post: {idea}")
+
+            except Exception as e:
+                logger.error(f"Error processing idea: {str(e)}")
+                failed_posts.append({"error": str(e)})
+
+    return posts, failed_posts
+
+
+def _research_with_early_start(niche: str, refresh: bool, num_posts: int,
+                               executor: ThreadPoolExecutor) -> Tuple[Dict, Dict[int, Dict]]:
+    """
+    Stream research and start generating each planned post as soon as the
+    trend it is based on arrives, instead of after the whole response.
+
+    Returns the research and ``{index: {"idea", "image", "caption"}}``
+    futures for the posts started early.
+    """
+    research = {"niche_trends": [], "content_trends": []}
+    early = {}
+    for section, trend in iter_research(niche, refresh=refresh):
+        research[section].append(trend)
+        # Same layout as content_planner: even posts use niche trend i // 2,
+        # odd posts content trend i // 2; later (wrapped) posts wait for the plan
+        if section == "niche_trends":
+            index, idea = 2 * (len(research[section]) - 1), f"Post about {trend}"
+        else:
+            index, idea = 2 * (len(research[section]) - 1) + 1, f"Post using {trend}"
+        if index < num_posts:
+            early[index] = {
+                "idea": idea,
+                "image": _start_image(executor, idea),
+                "caption": executor.submit(copy_context().run, generate_caption, idea)
+            }
+    return research, early
+
+
+def run_pipeline(niche: str, poster=None, refresh: bool = False,
+                 on_stage: Optional[StageCallback] = None, num_posts: int = 2,
+                 max_workers: Optional[int] = None, run_id: Optional[str] = None,
+                 budget: Optional[float] = None, carousel: bool = False) -> Dict:
+    """
+    Run research, planning, generation and publishing for one niche.
+
+    Every stage output is checkpointed under a run id. Passing the
+    ``run_id`` of an interrupted or failed run resumes it, re-executing
+    only the stages that did not complete. The run fails with
+    BudgetExceeded once its provider cost passes ``budget`` (USD, default
+    RUN_BUDGET); spend before a resume counts towards it. ``carousel``
+    publishes the posts as one carousel and is remembered for resumes.
+    """
+    start_time = datetime.now()
+    if run_id is None:
+        run_id = create_run(niche)
+    else:
+        mark_run_running(run_id)
+    run = RunCheckpoints(run_id)
+    if carousel and not run.get("carousel"):
+        run.save("carousel", True)
+    carousel = carousel or bool(run.get("carousel"))
+    with log_context(run_id=run_id, niche=niche):
+        logger.info(f"Started processing niche: {niche} (run {run_id})")
+
+        early = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers or Config.PIPELINE_MAX_WORKERS,
+                                      thread_name_prefix="early")
+        try:
+            research = run.get("research")
+            if research is None:
+                with _stage("research", on_stage):
+                    research, early = _research_with_early_start(niche, refresh, num_posts, executor)
+                run.save("research", research)
+            else:
+                _skipped("research", on_stage)
+            check_budget(run_id, budget)
+
+            plan = run.get("plan")
+            if plan is None:
+                with _stage("planning", on_stage):
+                    plan = content_planner(research, num_posts=num_posts)
+                run.save("plan", plan)
+            else:
+                _skipped("planning", on_stage)
+
+            posts, failed_posts = process_plan(niche, plan["content_plan"], poster=poster,
+                                               max_workers=max_workers, on_stage=on_stage,
+                                               run=run, early=early, budget=budget,
+                                               carousel=carousel)
+        except Exception as e:
+            finish_run(run_id, "failed", str(e))
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Runs with failed posts stay resumable
+        finish_run(run_id, "completed" if not failed_posts else "incomplete")
+
+    return {
+        "run_id": run_id,
+        "cost": round(run_cost(run_id), 6),
+        "posts": posts,
+        "failed_posts": failed_posts,
+        "time_taken": str(datetime.now() - start_time)
+    }
+
+
+def iter_pipeline(niche: str, poster=None, refresh: bool = False) -> Iterator[Dict]:
+    """
+    Run the pipeline for one niche, yielding an event as each post finishes.
+
+    Events are ``plan``, then one ``post`` or ``failed`` per idea in
+    completion order (with its plan ``index``), then ``done`` with the
+    totals and ``time_taken``.
+    """
+    # Step the generator in its own context so the niche reaches the logs
+    # and ledger rows without leaking into the consumer between events
+    context = copy_context()
+    events = _iter_pipeline(niche, poster, refresh)
+    try:
+        while True:
+            try:
+                event = context.run(next, events)
+            except StopIteration:
+                return
+            yield event
+    finally:
+        context.run(events.close)
+
+
+def _iter_pipeline(niche: str, poster, refresh: bool) -> Iterator[Dict]:
+    with log_context(niche=niche):
+        start_time = datetime.now()
+        logger.info(f"Started streaming niche: {niche}")
+
+        research = research_agent(niche, refresh=refresh)
+        ideas = content_planner(research)["content_plan"]
+        yield {"event": "plan", "ideas": ideas}
+
+        posted = failed = 0
+        for index, asset in iter_assets(ideas):
+            if "error" in asset:
+                failed += 1
+                yield {"event": "failed", "index": index, "idea": asset["idea"], "error": asset["error"]}
+                continue
+
+            idea, image_url, caption = asset["idea"], asset["image"], asset["caption"]
+            image_key = asset["image_key"]
+            try:
+                save_post(niche, idea, image_url, caption, image_key=image_key)
+                ok = poster is None or poster.post_content(image_url, caption, image_key=image_key)
+            except Exception as e:
+                logger.error(f"Error processing idea: {str(e)}")
+                failed += 1
+                yield {"event": "failed", "index": index, "idea": idea, "error": str(e)}
+                continue
+
+            if ok:
+                posted += 1
+            else:
+                failed += 1
+                logger.warning(f"Failed to post: {idea}")
+            yield {
+                "event": "post" if ok else "failed",
+                "index": index,
+                "idea": idea,
+                "image": image_url,
+                "image_key": image_key,
+                "caption": caption,
+                "posted": ok
+            }
+
+        yield {
+            "event": "done",
+            "posts": posted,
+            "failed": failed,
+            "time_taken": str(datetime.now() - start_time)
+        }
@@ -0,0 +1,238 @@
+import base64
+import hashlib
+import hmac
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Mapping
+from config import Config
+from database import get_connection, transaction
+from exceptions import APIError
+from ledger import record_call
+from logger import current_log_context, logger
+from metrics import call_failures, call_seconds
+from rate_limiter import get_limiter
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+# prediction id -> (future, submitted_at, log context) for predictions this process waits on
+_pending: Dict[str, tuple] = {}
+# Completions that arrived before the prediction was tracked: id -> (payload, received_at)
+_early: Dict[str, tuple] = {}
+# prediction id -> earliest time the poller fetches it again
+_next_poll: Dict[str, float] = {}
+_lock = threading.Lock()
+_poller = None
+_wakeup = threading.Event()
+
+
+def track(prediction_id: str, input_data: Dict, num_outputs: int = 1) -> Future:
+    """
+    Record a submitted prediction and return a future of its output URLs.
+
+    The future is resolved by :func:`complete` (webhook) or by the
+    background poller; no thread waits on the prediction itself.
+    """
+    now = time.time()
+    try:
+        with transaction() as conn:
+            conn.execute(
+                '''INSERT OR IGNORE INTO predictions (id, status, input, num_outputs, created_at, updated_at)
+                   VALUES (?,?,?,?,?,?)''',
+                (prediction_id, "starting", json.dumps(input_data), num_outputs, now, now)
+            )
+    except sqlite3.Error as e:
+        # The future still completes through polling
+        logger.warning(f"Prediction {prediction_id} not recorded: {str(e)}")
+
+    future = Future()
+    with _lock:
+        _pending[prediction_id] = (future, now, current_log_context())
+        early = _early.pop(prediction_id, None)
+    if early is not None:
+        complete(early[0])
+    _ensure_poller()
+    return future
+
+
+def _outputs(output) -> List[str]:
+    if output is None:
+        return []
+    return [str(item) for item in output] if isinstance(output, list) else [str(output)]
+
+
+def complete(prediction: Mapping) -> bool:
+    """
+    Apply a prediction payload (webhook body or polled prediction).
+
+    Returns True if the prediction reached a terminal state.
+    """
+    prediction_id = prediction.get("id")
+    status = prediction.get("status")
+    if not prediction_id or status not in TERMINAL_STATUSES:
+        return False
+
+    outputs = _outputs(prediction.get("output"))
+    error = prediction.get("error")
+    try:
+        with transaction() as conn:
+            conn.execute(
+                '''UPDATE predictions SET status = ?, output = ?, error = ?, updated_at = ?,
+                          completed_at = COALESCE(completed_at, ?)
+                   WHERE id = ?''',
+                (status, json.dumps(outputs), str(error) if error else None,
+                 time.time(), time.time(), prediction_id)
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Prediction {prediction_id} update failed: {str(e)}")
+
+    with _lock:
+        entry = _pending.pop(prediction_id, None)
+        _next_poll.pop(prediction_id, None)
+        if entry is None:
+            _early[prediction_id] = (dict(prediction), time.time())
+            return True
+
+    future, submitted_at, context = entry
+    # Billed prediction time when Replicate reports it, otherwise time since submission
+    predict_time = (prediction.get("metrics") or {}).get("predict_time")
+    latency = time.time() - submitted_at
+    # Same series the blocking backend records through @timed("image")
+    call_seconds.observe(latency, call="image")
+    if status != "succeeded" or not outputs:
+        call_failures.inc(call="image")
+    record_call("replicate", prediction.get("model") or "stability-ai/sdxl", "image",
+                "ok" if status == "succeeded" else status, latency,
+                cost=(predict_time if predict_time is not None else latency) * Config.REPLICATE_COST_PER_SECOND,
+                context=context)
+
+    if status == "succeeded" and outputs:
+        future.set_result(outputs)
+    else:
+        future.set_exception(APIError(f"Prediction {status}: {error or 'no output'}"))
+    return True
+
+
+def webhooks_enabled() -> bool:
+    """Webhooks need both a public URL and the signing secret; otherwise predictions are only polled"""
+    return bool(Config.REPLICATE_WEBHOOK_URL and Config.REPLICATE_WEBHOOK_SECRET)
+
+
+def verify_webhook(headers: Mapping, body: bytes) -> bool:
+    """Check Replicate's webhook signature; nothing passes without a secret"""
+    secret = Config.REPLICATE_WEBHOOK_SECRET
+    if not secret:
+        return False
+
+    webhook_id = headers.get("webhook-id", "")
+    timestamp = headers.get("webhook-timestamp", "")
+    signatures = headers.get("webhook-signature", "")
+    try:
+        if abs(time.time() - int(timestamp)) > 300:
+            return False
+        key = base64.b64decode(secret.split("_", 1)[-1])
+    except (TypeError, ValueError):
+        return False
+
+    signed = f"{webhook_id}.{timestamp}.".encode() + body
+    expected = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode()
+    return any(
+        hmac.compare_digest(expected, candidate.split(",", 1)[-1])
+        for candidate in signatures.split()
+    )
+
+
+def _completed_elsewhere(ids: List[str]) -> List[Dict]:
+    """Predictions another process already completed through its webhook route"""
+    placeholders = ",".join("?" * len(ids))
+    rows = get_connection().execute(
+        f'''SELECT id, status, output, error FROM predictions
+            WHERE id IN ({placeholders}) AND status IN ('succeeded', 'failed', 'canceled')''',
+        ids
+    ).fetchall()
+    return [dict(row, output=json.loads(row["output"] or "[]")) for row in rows]
+
+
+def _poll_once(client):
+    now = time.time()
+    with _lock:
+        pending = dict(_pending)
+        # Webhooks for predictions owned by other processes, or duplicates
+        for prediction_id, (_, received_at) in list(_early.items()):
+            if now - received_at > 300:
+                del _early[prediction_id]
+    if not pending:
+        return
+
+    try:
+        for prediction in _completed_elsewhere(list(pending)):
+            complete(prediction)
+            pending.pop(prediction["id"], None)
+    except sqlite3.Error as e:
+        logger.warning(f"Prediction lookup failed: {str(e)}")
+
+    grace = Config.REPLICATE_WEBHOOK_GRACE if webhooks_enabled() else 0
+    # Polls have their own rate budget so they never hold up submissions,
+    # and are not retried: a failed poll simply waits for its next turn
+    limiter = get_limiter("replicate_poll")
+    for prediction_id, (_, submitted_at, _) in pending.items():
+        age = now - submitted_at
+        if age > Config.REPLICATE_PREDICTION_TIMEOUT:
+            complete({"id": prediction_id, "status": "failed", "error": "timed out"})
+            continue
+        if age < grace or now < _next_poll.get(prediction_id, 0):
+            continue
+        # Long-running predictions are fetched less often
+        with _lock:
+            if prediction_id in _pending:
+                _next_poll[prediction_id] = now + min(
+                    Config.REPLICATE_POLL_MAX_INTERVAL,
+                    max(Config.REPLICATE_POLL_INTERVAL, age / 10)
+                )
+        outcome = {"throttled": False}
+        try:
+            with limiter.slot() as outcome:
+                prediction = client.predictions.get(prediction_id)
+            complete({
+                "id": prediction.id,
+                "status": prediction.status,
+                "output": prediction.output,
+                "error": prediction.error,
+                "metrics": prediction.metrics
+            })
+        except Exception as e:
+            logger.warning(f"Polling prediction {prediction_id} failed: {str(e)}")
+            if outcome["throttled"]:
+                # Leave the rest for the next round instead of piling on
+                break
+
+
+def _poller_loop():
+    from agents.image_generator import _replicate_client
+    while True:
+        _wakeup.wait(Config.REPLICATE_POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            _poll_once(_replicate_client())
+        except Exception as e:
+            logger.error(f"Prediction poller failed: {str(e)}")
+
+
+def _ensure_poller():
+    global _poller
+    if _poller is None:
+        with _lock:
+            if _poller is None:
+                _poller = threading.Thread(target=_poller_loop, name="prediction-poller", daemon=True)
+                _poller.start()
+
+
+def prediction_stats() -> Dict:
+    with _lock:
+        in_flight = len(_pending)
+    rows = get_connection().execute(
+        "SELECT status, COUNT(*) FROM predictions GROUP BY status"
+    ).fetchall()
+    return {"in_flight": in_flight, "by_status": {status: count for status, count in rows}}
@@ -0,0 +1,142 @@
+import re
+import textwrap
+import threading
+from typing import Dict, List, Optional
+from logger import logger
+from metrics import prompt_tokens
+from rate_limiter import estimate_tokens
+
+# Chat formatting overhead OpenAI adds per message and per reply
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_REPLY = 3
+
+_encodings: Dict[str, object] = {}
+_encodings_lock = threading.Lock()
+
+
+def compact(text: str) -> str:
+    """Dedent, strip every line, drop blank lines and collapse runs of spaces"""
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in textwrap.dedent(text).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _encoding(model: Optional[str]):
+    """tiktoken encoding for ``model``, or None when tiktoken isn't installed"""
+    key = model or ""
+    if key not in _encodings:
+        with _encodings_lock:
+            if key not in _encodings:
+                try:
+                    import tiktoken
+                    try:
+                        _encodings[key] = tiktoken.encoding_for_model(key)
+                    except KeyError:
+                        _encodings[key] = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    # Optional dependency (and its encodings may need a download)
+                    _encodings[key] = None
+    return _encodings[key]
+
+
+def has_tokenizer(model: Optional[str] = None) -> bool:
+    """Whether token counts for ``model`` are exact rather than estimated"""
+    return _encoding(model) is not None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Exact count with tiktoken when available, otherwise the rate limiter's estimate"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def message_tokens(messages: List[Dict], model: Optional[str] = None) -> int:
+    """Input tokens of a chat request, including per-message overhead"""
+    return sum(count_tokens(m["content"], model) + _TOKENS_PER_MESSAGE for m in messages) + _TOKENS_PER_REPLY
+
+
+class PromptTemplate:
+    """
+    A prompt split into a static ``system`` part and a ``user`` part with
+    ``str.format`` fields.
+
+    The system part never varies between calls, so every request starts
+    with the same tokens and provider-side prompt caching can reuse them;
+    the per-call values come last. Both parts are whitespace-compacted once.
+    """
+
+    def __init__(self, name: str, system: str, user: str):
+        self.name = name
+        self.system = compact(system)
+        self.user = compact(user)
+
+    def messages(self, model: Optional[str] = None, **values) -> List[Dict]:
+        """Chat messages for ``values``; the input token count is recorded per template"""
+        messages = [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**values)}
+        ]
+        tokens = message_tokens(messages, model)
+        prompt_tokens.observe(tokens, template=self.name)
+        logger.debug(f"Prompt {self.name}: {tokens} input tokens")
+        return messages
+
+    def render(self, **values) -> str:
+        """Single-string form, for APIs without chat roles"""
+        text = "\n".join(filter(None, (self.system, self.user.format(**values))))
+        prompt_tokens.observe(count_tokens(text), template=self.name)
+        return text
+
+
+RESEARCH = PromptTemplate(
+    "research",
+    system="""
+        You analyze industry trends for social media content creation.
+        Reply with 5 specific, actionable trends in this format:
+        Niche Trends:
+        1. [Specific trend 1]
+        2. [Specific trend 2]
+        Content Strategies:
+        1. [Content type 1 with example]
+        2. [Content type 2 with example]
+    """,
+    user="Niche: {niche}"
+)
+
+CAPTION = PromptTemplate(
+    "caption",
+    system="""
+        You write Instagram captions.
+        - Line 1: attention-grabbing hook with 1 relevant emoji
+        - Line 2: value proposition or interesting fact
+        - Line 3: call-to-action or question
+        - End with 3-5 niche-specific hashtags
+        - Under 250 characters in total
+        - Avoid generic phrases like "check this out"
+    """,
+    user="""
+        Tone: {tone}
+        Topic: {post_idea}
+    """
+)
+
+CAPTION_SHORTEN = PromptTemplate(
+    "caption_shorten",
+    system="""
+        Shorten Instagram captions to under 250 characters.
+        Keep the hook, the call-to-action and 3-5 hashtags.
+    """,
+    user="{caption}"
+)
+
+# SDXL has no chat roles and weights early words most, so the subject leads
+IMAGE = PromptTemplate(
+    "image",
+    system="",
+    user="""
+        Instagram-worthy photo for influencer post about: {post_idea}
+        Style: professional photography, vibrant colors, trending Instagram aesthetic
+        Details: natural lighting, modern composition, aspirational mood
+    """
+)
@@ -0,0 +1,244 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from config import Config
+from logger import logger
+from metrics import record_retry
+
+
+class TokenBucket:
+    """Refills ``rate_per_minute`` tokens per minute up to ``capacity``"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1):
+        """Block until ``amount`` tokens are available and take them"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, delta: float):
+        """Correct an earlier estimate once the real cost is known"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by about one slot per ``limit``
+    successes and halves on throttling or server errors.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, decrease: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    self.in_flight += 1
+                    return
+
+    def release(self, success: bool, throttled: bool = False, retry_after: Optional[float] = None):
+        with self._cond:
+            self.in_flight -= 1
+            self._adjust(success, throttled, retry_after)
+
+    def report(self, success: bool, throttled: bool = False, retry_after: Optional[float] = None):
+        """Feed back the outcome of a request made within an already held slot"""
+        with self._cond:
+            self._adjust(success, throttled, retry_after)
+
+    def _adjust(self, success: bool, throttled: bool, retry_after: Optional[float]):
+        if throttled:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        elif success:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self._cond.notify_all()
+
+
+def _status_of(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After / retry-after-ms header, if the error carries one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = _status_of(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Connection resets and timeouts carry no status
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class ProviderLimiter:
+    """Request rate, token rate and adaptive concurrency limits for one provider"""
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0,
+                 concurrency: int = 4, max_concurrency: int = 32):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(concurrency, maximum=max_concurrency)
+
+    @contextmanager
+    def slot(self, tokens: float = 0, held: bool = False):
+        """
+        Wait for rate budget and a concurrency slot; reports outcome on exit.
+        With ``held`` the caller already holds a slot (see :meth:`hold`).
+        """
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens and tokens:
+            self.tokens.acquire(tokens)
+        if not held:
+            self.concurrency.acquire()
+        outcome = {"success": False, "throttled": False, "retry_after": None}
+        try:
+            yield outcome
+        except Exception as e:
+            status = _status_of(e)
+            outcome["throttled"] = status is not None and (status == 429 or status >= 500)
+            outcome["retry_after"] = _retry_after(e)
+            raise
+        else:
+            outcome["success"] = True
+        finally:
+            if held:
+                self.concurrency.report(outcome["success"], outcome["throttled"], outcome["retry_after"])
+            else:
+                self.concurrency.release(outcome["success"], outcome["throttled"], outcome["retry_after"])
+
+    def hold(self) -> Callable[[bool], None]:
+        """
+        Take a concurrency slot for work that outlives a single request,
+        e.g. a queued prediction. Returns ``release(success)``, which must
+        be called exactly once when the work ends.
+        """
+        self.concurrency.acquire()
+        once = threading.Lock()
+
+        def release(success: bool):
+            if once.acquire(blocking=False):
+                self.concurrency.release(success)
+        return release
+
+    def call(self, func: Callable, *args, tokens: float = 0,
+             actual_tokens: Optional[Callable] = None, held: bool = False, **kwargs):
+        """
+        Call ``func`` within the limits, retrying 429/5xx/connection errors
+        with exponential backoff (or the provider's Retry-After). ``held``
+        skips taking a concurrency slot when the caller already has one.
+        """
+        attempts = Config.PROVIDER_MAX_ATTEMPTS
+        for attempt in range(1, attempts + 1):
+            try:
+                with self.slot(tokens, held=held):
+                    result = func(*args, **kwargs)
+                if self.tokens and tokens and actual_tokens:
+                    try:
+                        self.tokens.adjust(actual_tokens(result) - tokens)
+                    except (AttributeError, TypeError):
+                        pass
+                return result
+
+            except Exception as e:
+                if attempt == attempts or not is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(Config.PROVIDER_BACKOFF_MAX,
+                                Config.PROVIDER_BACKOFF_BASE * 2 ** (attempt - 1))
+                    delay *= random.uniform(0.5, 1.0)
+                record_retry(self.name)
+                logger.warning(f"{self.name} call failed ({str(e)}), retry {attempt} in {delay:.1f}s "
+                               f"(concurrency limit now {self.concurrency.limit:.1f})")
+                time.sleep(delay)
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _build(provider: str) -> ProviderLimiter:
+    if provider == "openai":
+        return ProviderLimiter(
+            "openai",
+            rpm=Config.OPENAI_RPM,
+            tpm=Config.OPENAI_TPM,
+            concurrency=Config.OPENAI_CONCURRENCY,
+            max_concurrency=Config.OPENAI_MAX_CONCURRENCY
+        )
+    if provider == "replicate":
+        return ProviderLimiter(
+            "replicate",
+            rpm=Config.REPLICATE_RPM,
+            concurrency=Config.REPLICATE_CONCURRENCY,
+            max_concurrency=Config.REPLICATE_MAX_CONCURRENCY
+        )
+    if provider == "replicate_poll":
+        # Status checks only; kept off the budget that submissions use
+        return ProviderLimiter("replicate_poll", rpm=Config.REPLICATE_POLL_RPM, concurrency=1, max_concurrency=4)
+    return ProviderLimiter(provider)
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """Process-wide limiter shared by every caller of a provider"""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                limiter = _limiters[provider] = _build(provider)
+    return limiter
+
+
+def estimate_tokens(text: str, completion_tokens: int = 0) -> int:
+    """Rough token estimate (about 4 characters per token) for rate budgeting"""
+    return len(text) // 4 + completion_tokens
@@ -0,0 +1,89 @@
+import json
+import re
+import sqlite3
+import time
+from typing import Dict, Optional
+from config import Config
+from database import get_connection, transaction
+from logger import logger
+from metrics import research_cache_lookups
+
+
+def normalize_niche(niche: str) -> str:
+    """Case- and whitespace-insensitive cache key for a niche"""
+    return re.sub(r"\s+", " ", niche).strip().lower()
+
+
+def _count(result: str):
+    research_cache_lookups.inc(result=result)
+
+
+def get_cached_research(niche: str) -> Optional[Dict]:
+    """Return cached research for a niche, or None on a miss or expired entry"""
+    key = normalize_niche(niche)
+    now = time.time()
+    try:
+        row = get_connection().execute(
+            "SELECT payload, created_at FROM research_cache WHERE niche_key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            _count("miss")
+            return None
+
+        payload, created_at = row
+        if now - created_at > Config.RESEARCH_CACHE_TTL:
+            with transaction() as conn:
+                conn.execute("DELETE FROM research_cache WHERE niche_key = ?", (key,))
+            _count("miss")
+            logger.debug(f"Research cache expired for: {key}")
+            return None
+
+        with transaction() as conn:
+            conn.execute(
+                "UPDATE research_cache SET last_accessed = ?, hits = hits + 1 WHERE niche_key = ?",
+                (now, key)
+            )
+        _count("hit")
+        logger.info(f"Research cache hit for: {key}")
+        return json.loads(payload)
+
+    except (sqlite3.Error, ValueError) as e:
+        # A broken cache must never break research
+        logger.warning(f"Research cache read failed: {str(e)}")
+        _count("miss")
+        return None
+
+
+def put_cached_research(niche: str, research: Dict):
+    """Store research for a niche and evict least recently used entries over the cap"""
+    key = normalize_niche(niche)
+    now = time.time()
+    try:
+        with transaction() as conn:
+            conn.execute(
+                '''INSERT OR REPLACE INTO research_cache
+                   (niche_key, payload, created_at, last_accessed, hits)
+                   VALUES (?,?,?,?,0)''',
+                (key, json.dumps(research), now, now)
+            )
+            conn.execute(
+                '''DELETE FROM research_cache WHERE niche_key IN
+                   (SELECT niche_key FROM research_cache
+                    ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)''',
+                (Config.RESEARCH_CACHE_MAX_ENTRIES,)
+            )
+
+    except sqlite3.Error as e:
+        logger.warning(f"Research cache write failed: {str(e)}")
+
+
+def cache_stats() -> Dict:
+    """Hit/miss counters for this process"""
+    stats = {
+        "hits": research_cache_lookups.value(result="hit"),
+        "misses": research_cache_lookups.value(result="miss")
+    }
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / total if total else 0.0
+    return stats
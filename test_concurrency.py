@@ -0,0 +1,122 @@
+"""
+Multi-worker safety: several processes migrating, claiming jobs, saving
+the Instagram session and passing 2FA codes through one database.
+
+    python -m pytest test_concurrency.py
+"""
+import glob
+import json
+import multiprocessing
+import os
+import tempfile
+
+WORKERS = 6
+JOBS_PER_WORKER = 20
+
+
+def _environment(workdir: str):
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(workdir, "posts.db"),
+        "INSTAGRAM_SESSION_FILE": os.path.join(workdir, "instagram_session.json"),
+        "LOG_LEVEL": "WARNING",
+        "TEST_MODE": "true"
+    })
+    # Config is read once per process; the test process itself reuses it across tests
+    from config import Config
+    Config.DATABASE_PATH = os.environ["DATABASE_PATH"]
+    Config.INSTAGRAM_SESSION_FILE = os.environ["INSTAGRAM_SESSION_FILE"]
+
+
+def _enqueue_and_claim(workdir: str):
+    _environment(workdir)
+    from database import init_db
+    from jobs import _claim_next, enqueue_job
+
+    init_db()
+    enqueued = [enqueue_job(f"niche {i}") for i in range(JOBS_PER_WORKER)]
+    claimed = []
+    while True:
+        job = _claim_next()
+        if job is None:
+            return enqueued, claimed
+        claimed.append(job["id"])
+
+
+class _Client:
+    """Just enough of an instagrapi client for AccountSession.save"""
+
+    def __init__(self, worker: int, step: int):
+        self.settings = {"worker": worker, "step": step, "cookies": {"sessionid": "x" * 2048}}
+
+    def get_settings(self):
+        return self.settings
+
+
+def _save_sessions(workdir: str, worker: int):
+    _environment(workdir)
+    from instagram_sessions import get_session
+    session = get_session("tester", "secret", os.environ["INSTAGRAM_SESSION_FILE"])
+    for step in range(50):
+        session.client = _Client(worker, step)
+        with session._process_lock():
+            session.save()
+            with open(session.session_file, encoding="utf-8") as f:
+                assert json.load(f) == session.client.settings
+
+
+def _pop_code(workdir: str):
+    _environment(workdir)
+    from instagram_sessions import pop_2fa_code
+    return pop_2fa_code("tester")
+
+
+def _pool(workers: int = WORKERS):
+    return multiprocessing.get_context("spawn").Pool(workers)
+
+
+def test_jobs_claimed_exactly_once():
+    workdir = tempfile.mkdtemp()
+    with _pool() as pool:
+        results = pool.map(_enqueue_and_claim, [workdir] * WORKERS)
+
+    enqueued = [job_id for ids, _ in results for job_id in ids]
+    claimed = [job_id for _, ids in results for job_id in ids]
+    assert len(claimed) == len(set(claimed)), "a job was claimed by two workers"
+    assert sorted(claimed) == sorted(enqueued)
+
+    _environment(workdir)
+    from database import SCHEMA_VERSION, get_connection
+    conn = get_connection()
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0] == len(enqueued)
+
+
+def test_session_file_never_torn():
+    workdir = tempfile.mkdtemp()
+    with _pool() as pool:
+        pool.starmap(_save_sessions, [(workdir, worker) for worker in range(WORKERS)])
+
+    with open(os.path.join(workdir, "instagram_session.json"), encoding="utf-8") as f:
+        assert json.load(f)["step"] == 49
+    assert not glob.glob(os.path.join(workdir, "*.part"))
+
+
+def test_2fa_code_used_once_across_workers():
+    workdir = tempfile.mkdtemp()
+    _environment(workdir)
+    from database import init_db
+    from instagram_sessions import store_2fa_code
+    init_db()
+    store_2fa_code(" 123456 ", "tester")
+
+    with _pool() as pool:
+        codes = pool.map(_pop_code, [workdir] * WORKERS)
+    assert sorted(codes, key=str) == ["123456"] + [None] * (WORKERS - 1)
+
+
+if __name__ == "__main__":
+    test_jobs_claimed_exactly_once()
+    test_session_file_never_torn()
+    test_2fa_code_used_once_across_workers()
+    print("Concurrency tests passed!")
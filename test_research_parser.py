@@ -0,0 +1,76 @@
+from agents.research_agent import ResearchParser, parse_research
+
+
+def test_numbered_sections():
+    research = parse_research(
+        "Here are the trends:\n\n"
+        "Niche Trends:\n1. Micro-workouts\n2. Recovery tech\n\n"
+        "Content Strategies:\n1. Form-check reels\n2) Myth-busting carousels\n"
+    )
+    assert research == {
+        "niche_trends": ["Micro-workouts", "Recovery tech"],
+        "content_trends": ["Form-check reels", "Myth-busting carousels"]
+    }
+
+
+def test_wrapped_line_continues_trend():
+    research = parse_research(
+        "Niche Trends:\n"
+        "1. Micro-workouts for busy professionals\n"
+        "   Short routines popular with content creators\n"
+        "2. Recovery tech\n"
+        "Content Strategies:\n"
+        "1. Form-check reels\n"
+    )
+    assert research["niche_trends"] == [
+        "Micro-workouts for busy professionals Short routines popular with content creators",
+        "Recovery tech"
+    ]
+    assert research["content_trends"] == ["Form-check reels"]
+
+
+def test_unnumbered_lists_keep_every_line():
+    research = parse_research(
+        "**Niche Trends**\n"
+        "Creator-led niche communities\n"
+        "Wearable recovery tracking\n"
+        "## Content Strategies\n"
+        "Strategic collabs\n"
+        "Day-in-the-life stories\n"
+    )
+    assert research == {
+        "niche_trends": ["Creator-led niche communities", "Wearable recovery tracking"],
+        "content_trends": ["Strategic collabs", "Day-in-the-life stories"]
+    }
+
+
+def test_markdown_headings_and_bullets():
+    research = parse_research(
+        "### Niche trends:\n- **Micro-workouts**\n* Recovery tech\n\n"
+        "**Content Strategies:**\n• Form-check reels\n\n"
+        "These ideas should keep your niche content fresh.\n"
+    )
+    assert research == {
+        "niche_trends": ["Micro-workouts", "Recovery tech"],
+        "content_trends": ["Form-check reels"]
+    }
+
+
+def test_streamed_items_emitted_once_complete():
+    parser = ResearchParser()
+    text = "Niche Trends:\n1. Micro-workouts for\n   busy people\n2. Recovery tech\n"
+    items = []
+    for i in range(0, len(text), 5):
+        items.extend(parser.feed(text[i:i + 5]))
+    # The last item may still continue until the stream ends
+    assert items == [("niche_trends", "Micro-workouts for busy people")]
+    assert parser.close() == [("niche_trends", "Recovery tech")]
+
+
+if __name__ == "__main__":
+    test_numbered_sections()
+    test_wrapped_line_continues_trend()
+    test_unnumbered_lists_keep_every_line()
+    test_markdown_headings_and_bullets()
+    test_streamed_items_emitted_once_complete()
+    print("Research parser tests passed!")
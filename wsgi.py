@@ -0,0 +1,12 @@
+"""
+Production entry point for multi-process, multi-threaded WSGI servers:
+
+    gunicorn --workers 4 --threads 8 wsgi:app
+
+Each worker process runs startup() once on import. Schema migrations run
+only in whichever process gets there first, logins share the session file
+under a file lock, and only one process runs the content calendar.
+"""
+from app import app, startup
+
+startup()